@@ -13,14 +13,19 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 import os
+import sys
 
-from dotenv import load_dotenv, find_dotenv
-
-load_dotenv(find_dotenv())
+from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# The only place .env is loaded; checked next to manage.py, then at the repo root
+for env_file in (BASE_DIR / ".env", BASE_DIR.parent / ".env"):
+    if env_file.exists():
+        load_dotenv(env_file)
+        break
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.0/howto/deployment/checklist/
@@ -51,6 +56,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "core.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -88,10 +94,53 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # File-backed test database: with the shared in-memory one, concurrent
+        # requests get "table is locked" at once instead of waiting out the busy timeout
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+# The default cache must be shared by all worker processes: cached JWT
+# principals, the leaderboard generation, the disease catalog version and the
+# case library's expansion lock are invalidated or taken through it. Redis is
+# used when REDIS_URL is set (requires the redis package), otherwise files in
+# CACHE_DIR, which covers workers on a single host.
+CACHES = {
+    "default": (
+        {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+        if os.environ.get("REDIS_URL")
+        else {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get("CACHE_DIR", BASE_DIR / ".cache"),
+            "OPTIONS": {"MAX_ENTRIES": 100000},
+        }
+    ),
+    # Evaluation results; LocMemCache evicts least recently used entries
+    # once MAX_ENTRIES is reached
+    "evaluations": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "evaluations",
+        "TIMEOUT": 60 * 60 * 24,
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
+# The test runner gets a private in-memory default cache, so test runs share
+# no state with each other or with the dev server's cache
+if sys.argv[1:2] == ["test"]:
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "tests",
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -110,6 +159,20 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# The first hasher is used for new passwords; hashes made by the others (or
+# with fewer iterations) are rehashed on the next successful login
+PASSWORD_HASHERS = [
+    "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
+
+# "pool" hashes passwords on a bounded worker pool, "inline" on the request thread
+PASSWORD_HASHING_STRATEGY = "pool"
+PASSWORD_HASHING_WORKERS = os.cpu_count() or 2
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
@@ -141,7 +204,16 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.CachedJWTAuthentication",
+    ),
+    "DEFAULT_RENDERER_CLASSES": (
+        "core.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "core.renderers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
     ),
 }
 
@@ -150,4 +222,150 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'USER_ID_FIELD': 'email',
     'USER_ID_CLAIM': 'email',
-}
\ No newline at end of file
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.PrincipalTokenObtainPairSerializer',
+}
+
+# Resolved JWT users are cached per process and in the default cache;
+# saving or deleting a user invalidates them
+AUTH_PRINCIPAL_CACHE_TTL = 60  # seconds in the shared cache
+AUTH_PRINCIPAL_LOCAL_TTL = 5  # seconds in the worker's own memory
+AUTH_PRINCIPAL_LOCAL_MAX_ENTRIES = 10000
+# Serve read actions listed in a view's claims_only_actions from token claims
+# alone, without any user lookup (deactivation applies once the token expires)
+AUTH_CLAIMS_ONLY_READS = False
+
+# Idempotency-Key support for chat actions (create, send_message, end_game)
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+IDEMPOTENCY_WAIT_TIMEOUT = 60  # seconds a duplicate waits for the first request
+IDEMPOTENCY_POLL_INTERVAL = 0.25
+# An in-progress key not completed within this many seconds is presumed to
+# belong to a dead worker and is taken over by the next retry
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
+# Concurrent end_game requests wait for the request that claimed the evaluation;
+# a claim older than EVALUATION_WAIT_TIMEOUT is treated as abandoned and re-claimed
+EVALUATION_WAIT_TIMEOUT = 60
+EVALUATION_POLL_INTERVAL = 0.25
+
+# Patient conversation memory: recent turns are sent verbatim, older ones are
+# folded into a rolling summary by a background task
+CONVERSATION_RECENT_TURNS = 6
+CONVERSATION_SUMMARY_BATCH_TURNS = 4
+CONVERSATION_MESSAGE_MAX_CHARS = 1000
+CONVERSATION_SUMMARY_MAX_TOKENS = 300
+BACKGROUND_TASK_WORKERS = 2
+
+# LLM model routing per call site and difficulty
+LLM_DEFAULT_MODEL = "gpt-3.5-turbo"
+LLM_ROUTES = {
+    "generate_patient": {"default": "gpt-3.5-turbo"},
+    "patient_response": {"easy": "gpt-4o-mini", "default": "gpt-3.5-turbo"},
+    "evaluate_answer": {"default": "gpt-4o"},
+    "conversation_summary": {"default": "gpt-4o-mini"},
+}
+LLM_MAX_CONCURRENT_REQUESTS = 16
+
+# Hedged requests: a second request is sent once the first one runs longer
+# than the route's observed latency percentile
+LLM_HEDGING_ENABLED = True
+LLM_HEDGE_PERCENTILE = 95
+LLM_HEDGE_INITIAL_DELAY = 8.0  # seconds, used until enough samples are collected
+LLM_HEDGE_MIN_DELAY = 1.0
+# At most this share of a route's requests is hedged, with up to
+# LLM_HEDGE_BUDGET_BURST hedges saved up for a burst of slow responses
+LLM_HEDGE_BUDGET = 0.05
+LLM_HEDGE_BUDGET_BURST = 5
+LLM_LATENCY_WINDOW = 200
+LLM_LATENCY_MIN_SAMPLES = 20
+
+# Optional micro-batching of concurrent patient replies
+LLM_BATCHING_ENABLED = False
+LLM_BATCH_WINDOW = 0.2  # seconds to collect a batch
+LLM_BATCH_MAX_SIZE = 16
+
+# Structured output: models that support JSON-schema constrained responses;
+# other models use JSON mode. Local repair is tried before any re-request.
+LLM_JSON_SCHEMA_MODELS = {"gpt-4o", "gpt-4o-mini"}
+LLM_STRUCTURED_MAX_RETRIES = 1
+
+# Patient case library: generated cases are reused across doctors per
+# (disease, difficulty), never twice for the same doctor
+PATIENT_CASE_LIBRARY_ENABLED = True
+PATIENT_CASE_LIBRARY_SIZE = 20  # cases kept per (disease, difficulty)
+PATIENT_CASE_REUSE_THRESHOLD = 3.0  # serves per case before the key is expanded
+
+# Disease sampling: weighted alias tables per difficulty, skipping diseases
+# the doctor played recently
+DISEASE_RECENT_HISTORY_SIZE = 10
+DISEASE_RECENT_HISTORY_TTL = 60 * 60 * 24 * 7
+DISEASE_SAMPLING_MAX_REJECTIONS = 16
+# Adaptive selection: diseases whose success rate (from DiseaseStats) is near
+# the difficulty's target are drawn more often; weights are refreshed in the
+# background, never on the request path
+DISEASE_ADAPTIVE_SELECTION = True
+DISEASE_TARGET_SUCCESS_RATE = {"easy": 0.8, "medium": 0.6, "hard": 0.4}
+DISEASE_ADAPTIVE_MIN_GAMES = 20  # fewer games keep the catalog weight
+DISEASE_ADAPTIVE_PRIOR_GAMES = 10
+DISEASE_ADAPTIVE_BANDWIDTH = 0.25
+DISEASE_ADAPTIVE_MIN_FACTOR = 0.2
+DISEASE_ADAPTIVE_REFRESH = 300  # seconds
+
+# Diagnosis autocomplete over the disease catalog
+AUTOCOMPLETE_MAX_RESULTS = 20
+AUTOCOMPLETE_COMPLETIONS_PER_NODE = 20
+AUTOCOMPLETE_MIN_SIMILARITY = 0.35
+
+# Evaluation: "hybrid" scores diagnosis accuracy locally and asks the LLM only
+# for the qualitative criteria, "offline" never calls the LLM, "llm" sends
+# everything to the LLM. Hybrid falls back to offline when the LLM fails.
+EVALUATION_MODE = "hybrid"
+DIAGNOSIS_FUZZY_MATCH_THRESHOLD = 0.85
+DIAGNOSIS_RELATED_THRESHOLD = 0.6
+DIAGNOSIS_UNRELATED_THRESHOLD = 0.3
+# Misspellings of names with at least DIAGNOSIS_TYPO_MIN_LENGTH letters also
+# count as correct, allowing one edit per DIAGNOSIS_TYPO_CHARS_PER_EDIT letters
+DIAGNOSIS_TYPO_MIN_LENGTH = 4
+DIAGNOSIS_TYPO_CHARS_PER_EDIT = 8
+
+# Evaluation result cache, keyed by a fingerprint of the correct diagnosis,
+# the normalized doctor questions and the normalized final answer
+EVALUATION_CACHE_ALIAS = "evaluations"
+EVALUATION_CACHE_TTL = 60 * 60 * 24
+
+# Response compression (brotli when installed, otherwise gzip)
+COMPRESSION_MIN_SIZE = 1024  # bytes
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
+
+# Staff full-text search (SQLite FTS5 over messages and chat diagnoses)
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+# Admin performance mode: estimated changelist counts and a paginated message inline
+ADMIN_PERFORMANCE_MODE = True
+ADMIN_COUNT_LIMIT = 10000  # filtered changelists count at most this many rows
+ADMIN_INLINE_MESSAGES_PER_PAGE = 50
+
+# Cold storage: finished chats older than this are packed into ChatArchive rows
+ARCHIVE_AFTER_DAYS = 30
+ARCHIVE_BATCH_SIZE = 200
+
+# Streaming exports: keyset window per query, rows fetched per round trip,
+# bytes per streamed block
+EXPORT_WINDOW_SIZE = 10000
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_BLOCK_SIZE = 64 * 1024
+EXPORT_GZIP_LEVEL = 6
+# Chats and scores are exported incrementally by timestamp; rows stamped within
+# this many seconds are left for the next run, so a slow commit is not skipped
+EXPORT_SETTLE_DELAY = 60
+
+# Data retention (purge_old_chats). None disables a policy; deleting finished
+# chats also lowers the doctors' points on their next recalculation
+RETENTION_ABANDONED_CHAT_DAYS = 14
+RETENTION_FINISHED_CHAT_DAYS = None
+RETENTION_BATCH_SIZE = 200  # chats per transaction
+RETENTION_PAUSE = 0.2  # seconds between batches, lets live writes through
+
+# Per-user statistics: finished games kept in each difficulty's history
+USER_STATS_RECENT_GAMES = 20
@@ -1,18 +1,114 @@
+from django.conf import settings
 from django.contrib import admin
-from .models import Chat, Message
+from django.urls import reverse
+from django.utils.html import format_html, format_html_join
+from .models import Chat, Disease, Message
+from .paginators import EstimatedCountPaginator
+from .search import filter_chats, filter_messages
+
+MESSAGES_PAGE_PARAM = "messages_page"
+# Объемные текстовые поля чата, не нужные в списке сообщений
+CHAT_BULKY_FIELDS = ("patient_data", "patient_responses", "system_prompt", "conversation_summary", "feedback")
+
+
+class PerformanceModeAdmin(admin.ModelAdmin):
+    """
+    With ADMIN_PERFORMANCE_MODE on, changelists use estimated counts and skip
+    the second full-table count shown next to search results.
+
+    Subclasses filter dates with list_filter rather than date_hierarchy, which
+    runs a DISTINCT over the truncated dates of the whole table on every load.
+    """
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        if settings.ADMIN_PERFORMANCE_MODE:
+            return EstimatedCountPaginator(queryset, per_page, orphans, allow_empty_first_page)
+        return super().get_paginator(request, queryset, per_page, orphans, allow_empty_first_page)
+
+    def get_changelist_instance(self, request):
+        self.show_full_result_count = not settings.ADMIN_PERFORMANCE_MODE
+        return super().get_changelist_instance(request)
+
+
+class SenderFilter(admin.SimpleListFilter):
+    """Fixed sender choices; the default filter lists them with a DISTINCT over all messages."""
+
+    title = "sender"
+    parameter_name = "sender"
+
+    def lookups(self, request, model_admin):
+        return [("doctor", "doctor"), ("patient", "patient")]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(sender=self.value())
+        return queryset
+
+
+def _messages_page(request):
+    try:
+        return max(1, int(request.GET.get(MESSAGES_PAGE_PARAM, 1)))
+    except ValueError:
+        return 1
+
 
 class MessageInline(admin.TabularInline):
     model = Message
     extra = 0
 
+    def get_queryset(self, request):
+        # Показываем одну страницу сообщений чата, а не всю переписку
+        qs = super().get_queryset(request)
+        object_id = request.resolver_match.kwargs.get("object_id")
+        if not settings.ADMIN_PERFORMANCE_MODE or object_id is None:
+            return qs
+        per_page = settings.ADMIN_INLINE_MESSAGES_PER_PAGE
+        offset = (_messages_page(request) - 1) * per_page
+        page_ids = list(
+            Message.objects.filter(chat_id=object_id)
+            .order_by("id")
+            .values_list("id", flat=True)[offset : offset + per_page]
+        )
+        return qs.filter(pk__in=page_ids)
+
+
 @admin.register(Chat)
-class ChatAdmin(admin.ModelAdmin):
+class ChatAdmin(PerformanceModeAdmin):
     list_display = ['id', 'doctor', 'start_time', 'is_finished', 'score']
-    list_filter = ['is_finished', 'start_time']
+    list_filter = ['is_finished', 'is_archived', 'start_time']
+    list_select_related = ['doctor']
     search_fields = ['doctor__username', 'diagnosis']
-    readonly_fields = ['patient_data', 'start_time', 'end_time']
+    readonly_fields = ['message_pages', 'patient_data', 'start_time', 'end_time', 'llm_calls', 'prompt_tokens', 'cached_prompt_tokens', 'completion_tokens']
     inlines = [MessageInline]
 
+    @admin.display(description="Messages")
+    def message_pages(self, obj):
+        if obj.pk is None:
+            return "-"
+        total = Message.objects.filter(chat_id=obj.pk).count()
+        per_page = settings.ADMIN_INLINE_MESSAGES_PER_PAGE
+        pages = range(1, (total + per_page - 1) // per_page + 1)
+        links = format_html_join(
+            " ", '<a href="?{}={}">{}</a>', ((MESSAGES_PAGE_PARAM, page, page) for page in pages)
+        )
+        changelist = reverse("admin:core_message_changelist")
+        return format_html(
+            '{} messages, pages: {} · <a href="{}?chat__id__exact={}">all in message list</a>',
+            total,
+            links,
+            changelist,
+            obj.pk,
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        # Диагнозы ищем по FTS-индексу вместо LIKE '%...%' по всей таблице
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        matches = filter_chats(queryset, search_term) | queryset.filter(
+            doctor__username__icontains=search_term
+        )
+        return matches, False
+
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         if request.user.is_superuser:
@@ -25,12 +121,24 @@ class ChatAdmin(admin.ModelAdmin):
         return super().has_change_permission(request, obj)
 
 @admin.register(Message)
-class MessageAdmin(admin.ModelAdmin):
+class MessageAdmin(PerformanceModeAdmin):
     list_display = ['id', 'chat', 'sender', 'timestamp']
-    list_filter = ['sender', 'timestamp']
+    list_filter = [SenderFilter, 'timestamp']
+    list_select_related = ['chat']
     search_fields = ['content', 'chat__doctor__username']
     readonly_fields = ['chat', 'sender', 'content', 'timestamp']
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        doctors_chats = Chat.objects.filter(
+            doctor__username__icontains=search_term
+        ).values("pk")
+        matches = filter_messages(queryset, search_term) | queryset.filter(
+            chat_id__in=doctors_chats
+        )
+        return matches, False
+
     def has_add_permission(self, request):
         return False
 
@@ -38,7 +146,15 @@ class MessageAdmin(admin.ModelAdmin):
         return False
 
     def get_queryset(self, request):
-        qs = super().get_queryset(request)
+        qs = super().get_queryset(request).defer(
+            *(f"chat__{field}" for field in CHAT_BULKY_FIELDS)
+        )
         if request.user.is_superuser:
             return qs
-        return qs.filter(chat__doctor=request.user)
\ No newline at end of file
+        return qs.filter(chat__doctor=request.user)
+
+@admin.register(Disease)
+class DiseaseAdmin(admin.ModelAdmin):
+    list_display = ['name', 'tier', 'weight', 'is_active']
+    list_filter = ['tier', 'is_active']
+    search_fields = ['name']
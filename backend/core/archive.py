@@ -0,0 +1,85 @@
+import json
+import zlib
+
+from django.db import transaction
+
+from .models import Chat, ChatArchive, Message
+
+# Поля чата, которые нужны только во время игры и уезжают в архив
+ARCHIVED_FIELDS = ("patient_data", "patient_responses", "system_prompt")
+
+CODECS = {
+    "zlib": (lambda data: zlib.compress(data, 9), zlib.decompress),
+}
+
+
+def pack(chat, messages):
+    """Serialize messages exactly as the API renders them, plus the bulky chat fields."""
+    from .serializers import MessageSerializer
+
+    document = {field: getattr(chat, field) for field in ARCHIVED_FIELDS}
+    document["messages"] = MessageSerializer(messages, many=True).data
+    raw = json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode()
+    compress, _ = CODECS["zlib"]
+    return "zlib", compress(raw), len(raw)
+
+
+def unpack(archive):
+    _, decompress = CODECS[archive.codec]
+    return json.loads(decompress(bytes(archive.payload)))
+
+
+def transcript(chat):
+    """Return the chat's archived document, decompressing it once per instance."""
+    if not hasattr(chat, "_archived_transcript"):
+        chat._archived_transcript = unpack(chat.archive)
+    return chat._archived_transcript
+
+
+def archive_batch(cutoff, batch_size):
+    """
+    Archive up to ``batch_size`` chats finished before ``cutoff``, oldest first.
+
+    Each batch commits on its own; archived chats are flagged, so a
+    re-run continues where an interrupted one stopped.
+    Returns ``(chats, messages, raw_bytes, packed_bytes)``.
+    """
+    with transaction.atomic():
+        chats = list(
+            Chat.objects.select_for_update()
+            .filter(is_finished=True, is_archived=False, end_time__lt=cutoff)
+            .order_by("id")[:batch_size]
+        )
+        if not chats:
+            return 0, 0, 0, 0
+
+        by_chat = {chat.pk: [] for chat in chats}
+        for message in Message.objects.filter(chat_id__in=by_chat).order_by("id"):
+            by_chat[message.chat_id].append(message)
+
+        archives = []
+        raw_total = packed_total = 0
+        for chat in chats:
+            messages = by_chat[chat.pk]
+            codec, payload, raw_size = pack(chat, messages)
+            archives.append(
+                ChatArchive(
+                    chat=chat,
+                    codec=codec,
+                    payload=payload,
+                    message_count=len(messages),
+                    first_message_id=messages[0].pk if messages else None,
+                    last_message_id=messages[-1].pk if messages else None,
+                    raw_size=raw_size,
+                    packed_size=len(payload),
+                )
+            )
+            raw_total += raw_size
+            packed_total += len(payload)
+
+        ChatArchive.objects.bulk_create(archives)
+        deleted, _ = Message.objects.filter(chat_id__in=by_chat).delete()
+        Chat.objects.filter(pk__in=by_chat).update(
+            is_archived=True, **{field: "" for field in ARCHIVED_FIELDS}
+        )
+    return len(chats), deleted, raw_total, packed_total
@@ -0,0 +1,144 @@
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+from .sampling import catalog
+
+_NON_WORD = re.compile(r"[^\w\s]")
+
+
+def normalize(text):
+    """Case-fold, treat ё as е and reduce punctuation to single spaces."""
+    text = text.casefold().replace("ё", "е")
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class _TrieNode:
+    __slots__ = ("children", "completions")
+
+    def __init__(self):
+        self.children = {}
+        self.completions = []
+
+
+class DiseaseIndex:
+    """
+    Prefix trie plus trigram index over disease names and synonyms.
+
+    Every word boundary of every name is inserted into the trie, so "гравис"
+    finds "Миастения гравис". Each trie node keeps its best completions
+    precomputed, so a lookup costs O(len(query)). The trigram index catches
+    misspellings the trie cannot.
+    """
+
+    def __init__(self, diseases, completions_per_node):
+        self.entries = []  # (normalized alias, alias, disease name)
+        self.aliases = defaultdict(list)  # disease name -> normalized aliases
+        self.by_alias = {}  # normalized alias -> disease name
+        for disease in diseases:
+            for alias in [disease.name, *disease.synonyms]:
+                normalized = normalize(alias)
+                if normalized:
+                    self.entries.append((normalized, alias, disease.name))
+                    self.aliases[disease.name].append(normalized)
+                    self.by_alias.setdefault(normalized, disease.name)
+
+        self.trie = _TrieNode()
+        self.trigram_index = defaultdict(set)
+        self.trigram_counts = []
+        for index, (normalized, alias, name) in enumerate(self.entries):
+            is_synonym = alias != name
+            starts = [0] + [m.end() for m in re.finditer(" ", normalized)]
+            for start in starts:
+                rank = (start > 0, is_synonym, len(name), name)
+                node = self.trie
+                for char in normalized[start:]:
+                    node = node.children.setdefault(char, _TrieNode())
+                    node.completions.append((rank, index))
+            grams = trigrams(normalized)
+            self.trigram_counts.append(len(grams))
+            for gram in grams:
+                self.trigram_index[gram].add(index)
+
+        # Оставляем в каждом узле только лучшие варианты
+        stack = [self.trie]
+        while stack:
+            node = stack.pop()
+            best, seen = [], set()
+            for _, index in sorted(node.completions):
+                name = self.entries[index][2]
+                if name not in seen:
+                    seen.add(name)
+                    best.append(index)
+                    if len(best) == completions_per_node:
+                        break
+            node.completions = best
+            stack.extend(node.children.values())
+
+    def prefix(self, query):
+        node = self.trie
+        for char in query:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.completions
+
+    def fuzzy(self, query, limit):
+        grams = trigrams(query)
+        overlap = defaultdict(int)
+        for gram in grams:
+            for index in self.trigram_index.get(gram, ()):
+                overlap[index] += 1
+
+        scored = []
+        for index, shared in overlap.items():
+            similarity = 2 * shared / (len(grams) + self.trigram_counts[index])
+            if similarity >= settings.AUTOCOMPLETE_MIN_SIMILARITY:
+                scored.append((-similarity, index))
+        scored.sort()
+        return [index for _, index in scored[: limit * 2]]
+
+    def search(self, text, limit):
+        query = normalize(text)
+        if not query:
+            return []
+        candidates = self.prefix(query)
+        if len(candidates) < limit:
+            candidates = candidates + self.fuzzy(query, limit)
+
+        results, seen = [], set()
+        for index in candidates:
+            _, alias, name = self.entries[index]
+            if name in seen:
+                continue
+            seen.add(name)
+            results.append({"name": name, "matched": alias})
+            if len(results) == limit:
+                break
+        return results
+
+
+_index = None
+_index_version = None
+_lock = threading.Lock()
+
+
+def get_index():
+    """Return the index for the current catalog, rebuilding it if the catalog changed."""
+    global _index, _index_version
+    catalog.refresh()
+    if _index is None or _index_version != catalog.version:
+        with _lock:
+            if _index is None or _index_version != catalog.version:
+                _index = DiseaseIndex(
+                    catalog.diseases, settings.AUTOCOMPLETE_COMPLETIONS_PER_NODE
+                )
+                _index_version = catalog.version
+    return _index
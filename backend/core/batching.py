@@ -0,0 +1,97 @@
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+
+from .llm import complete
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Collect completion requests over a short window and dispatch them together.
+
+    The provider has no synchronous multi-prompt endpoint, so a batch is sent
+    as a bounded concurrent fan-out over the shared client connection pool;
+    each caller receives its own reply through a Future.
+    """
+
+    def __init__(self, call_site, window, max_batch_size):
+        self.call_site = call_site
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_batch_size, thread_name_prefix=f"batch-{call_site}"
+        )
+        self._batch_sizes = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=f"batcher-{self.call_site}", daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, messages, **kwargs):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((future, messages, kwargs))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            with self._lock:
+                self._batch_sizes[len(batch)] += 1
+            logger.debug(f"Dispatching {self.call_site} batch of {len(batch)}")
+            for future, messages, kwargs in batch:
+                self._executor.submit(self._dispatch, future, messages, kwargs)
+
+    def _dispatch(self, future, messages, kwargs):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(complete(self.call_site, messages, **kwargs))
+        except Exception as exc:
+            future.set_exception(exc)
+
+    def stats(self):
+        with self._lock:
+            sizes = dict(self._batch_sizes)
+        batches = sum(sizes.values())
+        requests = sum(size * count for size, count in sizes.items())
+        return {
+            "batches": batches,
+            "requests": requests,
+            "mean_batch_size": round(requests / batches, 2) if batches else 0,
+            "batch_sizes": sizes,
+        }
+
+
+patient_reply_batcher = MicroBatcher(
+    "patient_response",
+    window=getattr(settings, "LLM_BATCH_WINDOW", 0.2),
+    max_batch_size=getattr(settings, "LLM_BATCH_MAX_SIZE", 16),
+)
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.db.models import Count, F, Q, Sum
+
+from .models import Chat, PatientCase
+from .parsing import PATIENT_SCHEMA, complete_structured, validate_patient
+from .prompts import compact_json
+from .sampling import sample_disease
+from .tasks import run_async
+
+logger = logging.getLogger(__name__)
+
+DESCRIPTION_QUALITY = {
+    "easy": "подробно и точно",
+    "medium": "достаточно точно, но может упустить некоторые детали",
+    "hard": "неточно, может путаться в описаниях и жаловаться на не связанные с болезнью симптомы",
+}
+
+
+def choose_disease(difficulty, doctor=None):
+    return sample_disease(difficulty, doctor).name
+
+
+def generate_case(disease, difficulty):
+    """Generate a fresh, validated patient case with the LLM."""
+    description_quality = DESCRIPTION_QUALITY.get(difficulty, DESCRIPTION_QUALITY["hard"])
+
+    prompt = f"""Создайте данные виртуального пациента с заболеванием: {disease}.
+        Пациент должен описывать свои симптомы {description_quality}.
+        Включите следующую информацию:
+        1. Имя
+        2. Возраст
+        3. Пол
+        4. Основные жалобы
+        5. История болезни
+        6. Дополнительная информация
+
+        Также создайте предварительные ответы пациента на следующие вопросы:
+        1. Опишите свои симптомы
+        2. Как долго у вас эти симптомы?
+        3. Есть ли у вас какие-либо аллергии или хронические заболевания?
+        4. Принимаете ли вы какие-либо лекарства?
+        5. Опишите свой внешний вид
+        6. Что вы чувствуете при касании или давлении в области дискомфорта?
+
+        Верните данные в формате JSON с тремя ключами: 'patient_data', 'patient_responses' и 'correct_diagnosis'."""
+
+    generated_data = complete_structured(
+        "generate_patient",
+        [{"role": "system", "content": prompt}],
+        "virtual_patient",
+        PATIENT_SCHEMA,
+        validate_patient,
+        difficulty=difficulty,
+    )
+    generated_data["correct_diagnosis"] = disease  # Устанавливаем правильный диагноз
+    return generated_data
+
+
+def content_hash(disease, difficulty, patient_data, patient_responses):
+    # Ключ библиотеки входит в хеш: одинаковый текст пациента у разных болезней
+    # не должен указывать на чужой случай с чужим правильным диагнозом
+    payload = compact_json([disease, difficulty, patient_data, patient_responses])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def store_case(disease, difficulty, generated_data):
+    """
+    Add a generated case to the library, unless its key is already full.
+
+    Cases are content-addressed, so storing the same content twice returns
+    the existing row.
+    """
+    digest = content_hash(
+        disease, difficulty, generated_data["patient_data"], generated_data["patient_responses"]
+    )
+    existing = PatientCase.objects.filter(content_hash=digest).first()
+    if existing is not None:
+        return existing
+
+    size = PatientCase.objects.filter(disease=disease, difficulty=difficulty).count()
+    if size >= settings.PATIENT_CASE_LIBRARY_SIZE:
+        return None
+    try:
+        return PatientCase.objects.create(
+            disease=disease,
+            difficulty=difficulty,
+            content_hash=digest,
+            patient_data=json.dumps(generated_data["patient_data"]),
+            patient_responses=json.dumps(generated_data["patient_responses"]),
+        )
+    except IntegrityError:
+        return PatientCase.objects.filter(content_hash=digest).first()
+
+
+def take_case(disease, difficulty, doctor):
+    """
+    Return a library case for the key that ``doctor`` has not played yet.
+
+    The least-served unseen case is chosen, with random tie-breaking. When
+    the key's reuse ratio crosses the threshold the library is expanded in
+    the background.
+    """
+    seen = Chat.objects.filter(doctor=doctor, case__isnull=False).values("case_id")
+    case = (
+        PatientCase.objects.filter(disease=disease, difficulty=difficulty)
+        .exclude(id__in=seen)
+        .order_by("times_served", "?")
+        .first()
+    )
+    if case is None:
+        return None
+
+    PatientCase.objects.filter(pk=case.pk).update(times_served=F("times_served") + 1)
+    maybe_expand(disease, difficulty)
+    return case
+
+
+def reuse_ratio(disease, difficulty):
+    stats = PatientCase.objects.filter(disease=disease, difficulty=difficulty).aggregate(
+        cases=Count("id"), served=Sum("times_served")
+    )
+    if not stats["cases"]:
+        return 0.0
+    return (stats["served"] or 0) / stats["cases"]
+
+
+def maybe_expand(disease, difficulty):
+    if reuse_ratio(disease, difficulty) < settings.PATIENT_CASE_REUSE_THRESHOLD:
+        return
+    size = PatientCase.objects.filter(disease=disease, difficulty=difficulty).count()
+    if size >= settings.PATIENT_CASE_LIBRARY_SIZE:
+        return
+    # Не запускаем параллельные расширения одного ключа
+    if cache.add(f"case-library-expand:{disease}:{difficulty}", True, timeout=300):
+        run_async(expand_library, disease, difficulty)
+
+
+def expand_library(disease, difficulty):
+    try:
+        store_case(disease, difficulty, generate_case(disease, difficulty))
+    finally:
+        cache.delete(f"case-library-expand:{disease}:{difficulty}")
+
+
+def savings_report():
+    """Generation calls avoided by serving chats from the library."""
+    chats = Chat.objects.aggregate(
+        total=Count("id"), from_library=Count("id", filter=Q(from_library=True))
+    )
+    fresh = chats["total"] - chats["from_library"]
+    # Кейсы, сгенерированные фоном, а не при создании чата
+    background = PatientCase.objects.exclude(
+        id__in=Chat.objects.filter(from_library=False, case__isnull=False).values("case_id")
+    ).count()
+    generation_calls = fresh + background
+    return {
+        "chats": chats["total"],
+        "served_from_library": chats["from_library"],
+        "generation_calls": generation_calls,
+        "library_cases": PatientCase.objects.count(),
+        "generation_calls_saved": chats["total"] - generation_calls,
+    }
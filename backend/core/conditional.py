@@ -0,0 +1,39 @@
+import hashlib
+
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def _strip_weak(etag):
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def make_etag(*parts):
+    """
+    Quoted ETag for the given state parts.
+
+    The parts are hashed: header values must be ASCII (Django MIME-encodes
+    anything else, which breaks If-None-Match), and state such as an email
+    address should not leak into a response header.
+    """
+    state = "-".join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(state.encode(), usedforsecurity=False).hexdigest())
+
+
+def not_modified(request, etag):
+    """Return a 304 response if the request's If-None-Match matches ``etag``."""
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header:
+        return None
+    candidates = {_strip_weak(candidate) for candidate in parse_etags(header)}
+    if etag in candidates or "*" in candidates:
+        return with_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+    return None
+
+
+def with_etag(response, etag):
+    response["ETag"] = etag
+    # Браузер должен каждый раз перепроверять ответ по ETag
+    response["Cache-Control"] = "private, no-cache"
+    return response
@@ -0,0 +1,38 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .autocomplete import normalize
+from .prompts import compact_json
+
+
+def _cache():
+    return caches[settings.EVALUATION_CACHE_ALIAS]
+
+
+def evaluation_fingerprint(correct_diagnosis, doctor_questions, doctor_answer):
+    """
+    Fingerprint of everything the evaluation depends on.
+
+    Questions and answers are normalized, so replays that differ only in case,
+    punctuation or spacing share one entry. The evaluation mode is part of
+    the key because each mode scores differently.
+    """
+    payload = compact_json(
+        [
+            settings.EVALUATION_MODE,
+            normalize(correct_diagnosis),
+            [normalize(question) for question in doctor_questions],
+            normalize(doctor_answer or ""),
+        ]
+    )
+    return "evaluation:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_cached_evaluation(key):
+    return _cache().get(key)
+
+
+def cache_evaluation(key, evaluation):
+    _cache().set(key, evaluation, settings.EVALUATION_CACHE_TTL)
@@ -0,0 +1,186 @@
+import csv
+import io
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from users.models import Profile
+
+from .archive import unpack
+from .models import Chat, ChatArchive, Message
+
+# Набор данных: queryset, выгружаемые колонки и курсор инкрементальной
+# выгрузки - поле, которое растет при каждом изменении выгружаемой строки.
+# Сообщения не меняются (id), чат выгружается после завершения игры
+# (end_time), очки и ранг профиля меняются на месте (updated_at)
+DATASETS = {
+    "chats": (
+        lambda: Chat.objects.filter(is_finished=True),
+        (
+            "id", "doctor_id", "difficulty", "status", "is_finished", "start_time",
+            "end_time", "correct_diagnosis", "diagnosis", "score", "from_library",
+            "evaluation_cached", "llm_calls", "prompt_tokens", "completion_tokens",
+        ),
+        "end_time",
+    ),
+    "messages": (
+        Message.objects.all,
+        ("id", "chat_id", "sender", "content", "timestamp"),
+        "id",
+    ),
+    "scores": (
+        Profile.objects.all,
+        ("id", "user_id", "user__username", "points", "rank", "updated_at"),
+        "updated_at",
+    ),
+}
+FORMATS = ("jsonl", "csv")
+
+_encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(",", ":"))
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def to_position(moment):
+    """Export position of a timestamp cursor: microseconds since the epoch."""
+    return (moment - _EPOCH) // timedelta(microseconds=1)
+
+
+def from_position(position):
+    return _EPOCH + timedelta(microseconds=position)
+
+
+def watermark(dataset):
+    """
+    Position up to which the dataset is exported now: the highest id for id
+    cursors, and EXPORT_SETTLE_DELAY ago for timestamp cursors, so rows whose
+    timestamp was taken before a slow commit are not skipped.
+    """
+    queryset, _, cursor = DATASETS[dataset]
+    if cursor == "id":
+        top = queryset().aggregate(top=Max("pk"))["top"] or 0
+        if dataset == "messages":
+            # Последние сообщения могут быть уже в архиве
+            archived = ChatArchive.objects.aggregate(top=Max("last_message_id"))["top"]
+            top = max(top, archived or 0)
+        return top
+    return to_position(timezone.now() - timedelta(seconds=settings.EXPORT_SETTLE_DELAY))
+
+
+def _after(cursor, value, pk):
+    if cursor == "id":
+        return Q(pk__gt=pk)
+    return Q(**{f"{cursor}__gt": value}) | Q(**{cursor: value, "pk__gt": pk})
+
+
+def iter_rows(dataset, since=0, until=None):
+    """
+    Yield value tuples whose cursor position is in ``(since, until]``, in
+    (cursor, pk) order.
+
+    Each keyset window (``(cursor, pk) > last`` ... LIMIT) is a cheap index
+    range scan, however deep into the table the export is, and rows inside a
+    window are streamed with iterator() instead of being loaded at once.
+    Archived messages follow the live ones.
+    """
+    queryset, fields, cursor = DATASETS[dataset]
+    window = settings.EXPORT_WINDOW_SIZE
+    decode = (lambda position: position) if cursor == "id" else from_position
+    rows = queryset().filter(**{f"{cursor}__gt": decode(since)})
+    if until is not None:
+        rows = rows.filter(**{f"{cursor}__lte": decode(until)})
+    rows = rows.order_by(cursor, "pk").values_list(*fields, cursor)
+
+    last = None
+    while True:
+        page = rows if last is None else rows.filter(_after(cursor, *last))
+        count = 0
+        for row in page[:window].iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+            count += 1
+            last = (row[-1], row[0])
+            yield row[:-1]
+        if count < window:
+            break
+
+    if dataset == "messages":
+        yield from _archived_messages(since, until)
+
+
+def _archived_messages(since, until):
+    """Messages of archived chats with ``since < id <= until``, from their transcripts."""
+    archives = ChatArchive.objects.filter(last_message_id__gt=since)
+    if until is not None:
+        archives = archives.filter(first_message_id__lte=until)
+    # Архивы большие: забираем их понемногу
+    for chat_id, codec, payload in (
+        archives.order_by("pk").values_list("chat_id", "codec", "payload").iterator(chunk_size=100)
+    ):
+        document = unpack(ChatArchive(codec=codec, payload=payload))
+        for message in document["messages"]:
+            if since < message["id"] and (until is None or message["id"] <= until):
+                yield (
+                    message["id"],
+                    chat_id,
+                    message["sender"],
+                    message["content"],
+                    parse_datetime(message["timestamp"]),
+                )
+
+
+def _encode_jsonl(fields, rows):
+    for row in rows:
+        yield _encoder.encode(dict(zip(fields, row))) + "\n"
+
+
+def _encode_csv(fields, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow(row)
+        # Отдаем накопленное и очищаем буфер, чтобы память не росла
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _batched(chunks, size):
+    """Join small text chunks into blocks of about ``size`` bytes."""
+    batch, length = [], 0
+    for chunk in chunks:
+        batch.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield "".join(batch).encode()
+            batch, length = [], 0
+    if batch:
+        yield "".join(batch).encode()
+
+
+def _gzipped(blocks):
+    compressor = zlib.compressobj(settings.EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31)
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(dataset, fmt="jsonl", since=0, until=None, gzip=False):
+    """Yield the encoded export as byte blocks; memory use does not depend on its size."""
+    _, fields, _ = DATASETS[dataset]
+    columns = [field.split("__")[-1] for field in fields]
+    rows = iter_rows(dataset, since, until)
+    encode = _encode_jsonl if fmt == "jsonl" else _encode_csv
+    blocks = _batched(encode(columns, rows), settings.EXPORT_BLOCK_SIZE)
+    return _gzipped(blocks) if gzip else blocks
+
+
+def filename(dataset, fmt, since, until, gzip):
+    name = f"{dataset}-{since + 1}-{until}.{fmt}"
+    return f"{name}.gz" if gzip else name
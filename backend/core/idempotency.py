@@ -0,0 +1,191 @@
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+
+def _ttl():
+    return getattr(settings, "IDEMPOTENCY_KEY_TTL", timedelta(hours=24))
+
+
+def _wait_timeout():
+    return getattr(settings, "IDEMPOTENCY_WAIT_TIMEOUT", 60)
+
+
+def _poll_interval():
+    return getattr(settings, "IDEMPOTENCY_POLL_INTERVAL", 0.25)
+
+
+def _lock_timeout():
+    return getattr(settings, "IDEMPOTENCY_LOCK_TIMEOUT", 60)
+
+
+def _lock_expired(record):
+    return record.status == "in_progress" and (
+        record.locked_until is None or record.locked_until <= timezone.now()
+    )
+
+
+def _replay(record):
+    response = Response(
+        json.loads(record.response_body), status=record.response_status
+    )
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _claim(user, key, endpoint):
+    """
+    Insert an in-progress record for the key, or return the existing one.
+
+    An in-progress record whose lock has lapsed is taken over instead: the
+    request that created it is presumed dead.
+    """
+    now = timezone.now()
+    locked_until = now + timedelta(seconds=_lock_timeout())
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(
+                user=user,
+                key=key,
+                endpoint=endpoint,
+                expires_at=now + _ttl(),
+                locked_until=locked_until,
+            )
+        return None
+    except IntegrityError:
+        pass
+
+    record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record is not None and record.expires_at <= now:
+        # Просроченный ключ считаем новым запросом
+        record.delete()
+        return _claim(user, key, endpoint)
+    if record is not None and record.endpoint == endpoint and _lock_expired(record):
+        # Условный UPDATE: из нескольких повторов ключ забирает только один
+        taken = IdempotencyKey.objects.filter(
+            pk=record.pk, status="in_progress", locked_until=record.locked_until
+        ).update(locked_until=locked_until)
+        if taken:
+            logger.warning(f"Taking over idempotency key {key} after its lock expired")
+            return None
+        return IdempotencyKey.objects.filter(pk=record.pk).first()
+    return record
+
+
+@contextmanager
+def _lock_renewal(user, key):
+    """
+    Keep extending the key's lock from a helper thread while the action runs.
+
+    LLM calls with retries can outlast IDEMPOTENCY_LOCK_TIMEOUT; without
+    renewal a client retry would take the key over and repeat the action.
+    """
+    stop = threading.Event()
+
+    def renew():
+        try:
+            while not stop.wait(_lock_timeout() / 3):
+                try:
+                    IdempotencyKey.objects.filter(
+                        user_id=user.pk, key=key, status="in_progress"
+                    ).update(locked_until=timezone.now() + timedelta(seconds=_lock_timeout()))
+                except DatabaseError:
+                    logger.exception(f"Could not renew the lock of idempotency key {key}")
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=renew, name="idempotency-lock", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _wait_for_completion(record):
+    deadline = time.monotonic() + _wait_timeout()
+    while time.monotonic() < deadline:
+        time.sleep(_poll_interval())
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+        if record is None or record.status == "completed" or _lock_expired(record):
+            return record
+    return IdempotencyKey.objects.filter(pk=record.pk).first()
+
+
+def idempotent(action_name):
+    """
+    Make a viewset action safe to retry with an ``Idempotency-Key`` header.
+
+    The first request for a key runs the action and stores its response;
+    retries replay the stored response, and duplicates arriving while the
+    first request is still running wait for it instead of recomputing.
+    """
+
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return view_method(self, request, *args, **kwargs)
+
+            endpoint = f"{action_name}:{kwargs.get('pk', '')}"
+            record = _claim(request.user, key, endpoint)
+
+            if record is not None:
+                if record.endpoint != endpoint:
+                    return Response(
+                        {"error": "Idempotency-Key was already used for another request"},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    )
+                if record.status != "completed":
+                    logger.info(f"Waiting for in-progress request with key {key}")
+                    record = _wait_for_completion(record)
+                if record is None or _lock_expired(record):
+                    # Первый запрос завершился ошибкой или его воркер умер - выполняем заново
+                    return wrapper(self, request, *args, **kwargs)
+                if record.status != "completed":
+                    return Response(
+                        {"error": "A request with this Idempotency-Key is still in progress"},
+                        status=status.HTTP_409_CONFLICT,
+                    )
+                return _replay(record)
+
+            try:
+                with _lock_renewal(request.user, key):
+                    response = view_method(self, request, *args, **kwargs)
+            except Exception:
+                IdempotencyKey.objects.filter(user=request.user, key=key).delete()
+                raise
+
+            if response.status_code >= 500:
+                IdempotencyKey.objects.filter(user=request.user, key=key).delete()
+                return response
+
+            IdempotencyKey.objects.filter(user=request.user, key=key).update(
+                status="completed",
+                response_status=response.status_code,
+                response_body=json.dumps(response.data, cls=JSONEncoder),
+            )
+            return response
+
+        return wrapper
+
+    return decorator
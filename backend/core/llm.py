@@ -0,0 +1,197 @@
+import os
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+from django.db.models import F
+
+from .models import Chat
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class LLMError(Exception):
+    """The LLM provider could not be reached or rejected the request."""
+
+
+def get_client():
+    """
+    Return the shared OpenAI client, creating it on first use.
+
+    The openai package pulls in httpx and pydantic, so it is imported here
+    rather than at module import to keep worker boot and manage.py fast.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+
+                _client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+    return _client
+
+
+def _cached_tokens(usage):
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        return details.get("cached_tokens") or 0
+    return getattr(details, "cached_tokens", 0) or 0
+
+
+def record_usage(chat_id, response, call_site):
+    """Log the token usage of a completion and add it to the chat's counters."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    cached = _cached_tokens(usage)
+    logger.info(
+        f"LLM {call_site} for chat {chat_id}: prompt={usage.prompt_tokens} "
+        f"cached={cached} completion={usage.completion_tokens}"
+    )
+    Chat.objects.filter(pk=chat_id).update(
+        llm_calls=F("llm_calls") + 1,
+        prompt_tokens=F("prompt_tokens") + usage.prompt_tokens,
+        cached_prompt_tokens=F("cached_prompt_tokens") + cached,
+        completion_tokens=F("completion_tokens") + usage.completion_tokens,
+    )
+
+
+class LatencyTracker:
+    """Sliding window of completion latencies per route, used for hedging."""
+
+    def __init__(self, window=200, min_samples=20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._lock = threading.Lock()
+
+    def record(self, route, seconds):
+        with self._lock:
+            self._samples[route].append(seconds)
+
+    def percentile(self, route, percent):
+        with self._lock:
+            samples = sorted(self._samples.get(route, ()))
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percent / 100))
+        return samples[index]
+
+    def snapshot(self):
+        with self._lock:
+            routes = list(self._samples)
+        return {
+            route: self.percentile(route, settings.LLM_HEDGE_PERCENTILE)
+            for route in routes
+        }
+
+
+class HedgeBudget:
+    """
+    Token bucket that keeps hedges to a fraction of each route's requests:
+    every request deposits ``ratio`` of a token and a hedge spends a whole one.
+    """
+
+    def __init__(self, ratio, burst):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def deposit(self, route):
+        with self._lock:
+            self._tokens[route] = min(self.burst, self._tokens[route] + self.ratio)
+
+    def withdraw(self, route):
+        with self._lock:
+            if self._tokens[route] < 1:
+                return False
+            self._tokens[route] -= 1
+            return True
+
+
+latency_tracker = LatencyTracker(
+    window=getattr(settings, "LLM_LATENCY_WINDOW", 200),
+    min_samples=getattr(settings, "LLM_LATENCY_MIN_SAMPLES", 20),
+)
+
+hedge_budget = HedgeBudget(
+    ratio=getattr(settings, "LLM_HEDGE_BUDGET", 0.05),
+    burst=getattr(settings, "LLM_HEDGE_BUDGET_BURST", 5),
+)
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "LLM_MAX_CONCURRENT_REQUESTS", 16),
+    thread_name_prefix="llm",
+)
+
+
+def select_model(call_site, difficulty=None):
+    routes = settings.LLM_ROUTES.get(call_site, {})
+    return routes.get(difficulty) or routes.get("default") or settings.LLM_DEFAULT_MODEL
+
+
+def _hedge_delay(route):
+    observed = latency_tracker.percentile(route, settings.LLM_HEDGE_PERCENTILE)
+    if observed is None:
+        return settings.LLM_HEDGE_INITIAL_DELAY
+    return max(observed, settings.LLM_HEDGE_MIN_DELAY)
+
+
+def _timed_create(route, running=None, **kwargs):
+    from openai import OpenAIError
+
+    if running is not None:
+        running.set()
+    started = time.monotonic()
+    try:
+        response = get_client().chat.completions.create(**kwargs)
+    except OpenAIError as exc:
+        raise LLMError(str(exc)) from exc
+    latency_tracker.record(route, time.monotonic() - started)
+    return response
+
+
+def complete(call_site, messages, difficulty=None, chat_id=None, **kwargs):
+    """
+    Run a chat completion on the model routed for ``call_site``.
+
+    If the request is still running after the route's observed p95 latency,
+    a second identical request is sent and whichever finishes first wins.
+    The delay counts from when the request starts executing, not from when it
+    was queued, and hedges are capped by the route's hedge budget.
+    """
+    model = select_model(call_site, difficulty)
+    route = f"{call_site}:{model}"
+    request = dict(model=model, messages=messages, **kwargs)
+
+    if not settings.LLM_HEDGING_ENABLED:
+        response = _timed_create(route, **request)
+    else:
+        hedge_budget.deposit(route)
+        running = threading.Event()
+        pending = {_executor.submit(_timed_create, route, running, **request)}
+        # Ожидание в очереди пула не входит в задержку: при занятом пуле
+        # иначе хеджировался бы каждый запрос
+        running.wait()
+        done, pending = wait(pending, timeout=_hedge_delay(route))
+        if not done and hedge_budget.withdraw(route):
+            logger.info(f"Hedging slow LLM request on route {route}")
+            pending.add(_executor.submit(_timed_create, route, **request))
+
+        response = None
+        while response is None:
+            if not done:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            future = done.pop()
+            if future.exception() is None or not (pending or done):
+                response = future.result()
+
+    if chat_id is not None:
+        record_usage(chat_id, response, call_site)
+    return response
@@ -0,0 +1,84 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from core.archive import archive_batch
+from core.models import ChatArchive, Message
+
+
+def table_size(table):
+    """On-disk size of a table and its indexes in bytes (SQLite dbstat), or None."""
+    if connection.vendor != "sqlite":
+        return None
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name = %s "
+                "OR name IN (SELECT name FROM sqlite_master WHERE tbl_name = %s AND type = 'index')",
+                [table, table],
+            )
+        except DatabaseError:
+            return None
+        return cursor.fetchone()[0] or 0
+
+
+def _mb(size):
+    return "n/a" if size is None else f"{size / 1024 / 1024:.1f} MB"
+
+
+class Command(BaseCommand):
+    help = (
+        "Move finished chats older than ARCHIVE_AFTER_DAYS into compressed ChatArchive rows "
+        "and delete their messages. Runs in batches and can be interrupted and resumed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.ARCHIVE_AFTER_DAYS)
+        parser.add_argument("--batch-size", type=int, default=settings.ARCHIVE_BATCH_SIZE)
+        parser.add_argument("--max-batches", type=int, default=None)
+        parser.add_argument("--report", action="store_true", help="Only print the space report")
+
+    def handle(self, *args, **options):
+        if not options["report"]:
+            self.archive(options)
+        self.report()
+
+    def archive(self, options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        batches = chats = messages = raw = packed = 0
+        started = time.monotonic()
+        while options["max_batches"] is None or batches < options["max_batches"]:
+            batch = archive_batch(cutoff, options["batch_size"])
+            if not batch[0]:
+                break
+            batches += 1
+            chats, messages, raw, packed = (
+                total + value for total, value in zip((chats, messages, raw, packed), batch)
+            )
+            self.stdout.write(f"Batch {batches}: {batch[0]} chats, {batch[1]} messages")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {chats} chats and {messages} messages in {time.monotonic() - started:.1f} s "
+                f"({_mb(raw)} of transcripts packed into {_mb(packed)})"
+            )
+        )
+
+    def report(self):
+        totals = ChatArchive.objects.aggregate(
+            chats=Count("pk"), messages=Sum("message_count"), raw=Sum("raw_size"), packed=Sum("packed_size")
+        )
+        raw, packed = totals["raw"] or 0, totals["packed"] or 0
+        ratio = f"{raw / packed:.1f}x" if packed else "n/a"
+        self.stdout.write(
+            f"\nArchive: {totals['chats']} chats, {totals['messages'] or 0} messages, "
+            f"{_mb(raw)} packed into {_mb(packed)} ({ratio}, saved {_mb(raw - packed)})"
+        )
+        self.stdout.write(
+            f"Hot message table: {Message.objects.count()} rows, {_mb(table_size('core_message'))} "
+            f"with indexes; archive table: {_mb(table_size('core_chatarchive'))}"
+        )
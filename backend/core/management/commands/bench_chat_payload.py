@@ -0,0 +1,85 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from core.middleware import brotli, compress
+from core.renderers import FastJSONRenderer, orjson
+
+PATIENT_DATA = {
+    "Имя": "Иван Петрович Сидоров",
+    "Возраст": 47,
+    "Пол": "мужской",
+    "Основные жалобы": "Сильная головная боль, тошнота, светобоязнь, слабость по утрам",
+    "История болезни": "Головные боли беспокоят около двух лет, приступы участились за последний месяц. " * 3,
+    "Дополнительная информация": "Работает бухгалтером, много времени проводит за компьютером.",
+}
+
+
+def build_chat(messages):
+    return {
+        "id": 1,
+        "doctor": 1,
+        "patient_data": PATIENT_DATA,
+        "start_time": "2024-08-17T15:06:00.000000Z",
+        "end_time": None,
+        "diagnosis": None,
+        "score": None,
+        "feedback": None,
+        "is_finished": False,
+        "status": "active",
+        "difficulty": "medium",
+        "messages": [
+            {
+                "id": index,
+                "sender": "doctor" if index % 2 == 0 else "patient",
+                "content": (
+                    "Скажите, пожалуйста, как давно у вас появились эти симптомы и что их усиливает?"
+                    if index % 2 == 0
+                    else "Доктор, это началось примерно две недели назад, сначала слабо, потом сильнее. " * 2
+                ),
+                "timestamp": "2024-08-17T15:06:00.000000Z",
+            }
+            for index in range(messages)
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = "Benchmark chat payload serialization time and bytes on the wire"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, nargs="+", default=[20, 200, 1000])
+        parser.add_argument("--repeat", type=int, default=200)
+
+    def _time(self, func, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            result = func()
+        return (time.perf_counter() - started) / repeat * 1e6, result
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING("orjson is not installed, the fast renderer falls back to DRF"))
+        drf, fast = JSONRenderer(), FastJSONRenderer()
+        repeat = options["repeat"]
+
+        for count in options["messages"]:
+            chat = build_chat(count)
+            # Рендерер DRF по умолчанию, но с экранированием не-ASCII, как у json.dumps
+            drf.ensure_ascii = True
+            ascii_us, ascii_body = self._time(lambda: drf.render(chat), repeat)
+            drf.ensure_ascii = False
+            drf_us, drf_body = self._time(lambda: drf.render(chat), repeat)
+            fast_us, fast_body = self._time(lambda: fast.render(chat), repeat)
+
+            self.stdout.write(f"\nChat with {count} messages")
+            self.stdout.write(f"  DRF (ASCII-escaped): {ascii_us:9.1f} us  {len(ascii_body):>9} bytes")
+            self.stdout.write(f"  DRF (UTF-8):         {drf_us:9.1f} us  {len(drf_body):>9} bytes")
+            self.stdout.write(f"  FastJSONRenderer:    {fast_us:9.1f} us  {len(fast_body):>9} bytes")
+
+            gzip_us, gzipped = self._time(lambda: compress(fast_body, "gzip"), max(repeat // 10, 1))
+            self.stdout.write(f"  + gzip:              {gzip_us:9.1f} us  {len(gzipped):>9} bytes")
+            if brotli is not None:
+                br_us, brotlied = self._time(lambda: compress(fast_body, "br"), max(repeat // 10, 1))
+                self.stdout.write(f"  + brotli:            {br_us:9.1f} us  {len(brotlied):>9} bytes")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+
+from core.case_library import savings_report
+from core.models import PatientCase
+
+
+class Command(BaseCommand):
+    help = "Report patient case library size, reuse and generation calls saved"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--per-key", action="store_true", help="Show every (disease, difficulty) key")
+
+    def handle(self, *args, **options):
+        if options["per_key"]:
+            keys = (
+                PatientCase.objects.values("disease", "difficulty")
+                .annotate(cases=Count("id"), served=Sum("times_served"))
+                .order_by("difficulty", "disease")
+            )
+            for key in keys:
+                ratio = (key["served"] or 0) / key["cases"]
+                self.stdout.write(
+                    f"{key['difficulty']:<7} {key['disease']}: {key['cases']} cases, "
+                    f"{key['served'] or 0} serves, reuse {ratio:.2f}"
+                )
+
+        for name, value in savings_report().items():
+            self.stdout.write(f"{name}: {value}")
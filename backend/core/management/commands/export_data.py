@@ -0,0 +1,65 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.export import DATASETS, FORMATS, export_stream, watermark
+from core.models import ExportWatermark
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream chats, messages or profile scores as JSONL or CSV (optionally gzipped). "
+        "With --watermark, only rows added or changed since the previous run of that export "
+        "are written: new messages, newly finished chats and changed scores."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("dataset", choices=list(DATASETS))
+        parser.add_argument("--format", choices=FORMATS, default="jsonl")
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument("--output", default="-", help="File path, '-' for stdout")
+        parser.add_argument(
+            "--since",
+            type=int,
+            default=0,
+            help="Export rows past this position (an id for messages, a timestamp in "
+            "microseconds since the epoch for chats and scores)",
+        )
+        parser.add_argument(
+            "--watermark",
+            default=None,
+            help="Name of an incremental export; resumes after its last exported position",
+        )
+
+    def handle(self, *args, **options):
+        dataset = options["dataset"]
+        since = options["since"]
+        mark = None
+        if options["watermark"]:
+            mark, _ = ExportWatermark.objects.get_or_create(
+                name=options["watermark"], defaults={"dataset": dataset}
+            )
+            if mark.dataset != dataset:
+                raise CommandError(
+                    f"Watermark {mark.name!r} belongs to the {mark.dataset!r} export"
+                )
+            since = max(since, mark.position)
+        until = watermark(dataset)
+
+        output = sys.stdout.buffer if options["output"] == "-" else open(options["output"], "wb")
+        written = 0
+        try:
+            for block in export_stream(dataset, options["format"], since, until, options["gzip"]):
+                output.write(block)
+                written += len(block)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+
+        # Водяной знак сдвигаем только после успешной записи всего файла
+        if mark is not None:
+            mark.position = until
+            mark.save(update_fields=["position", "updated_at"])
+        self.stderr.write(
+            f"Exported {dataset} at positions {since + 1}..{until} ({written} bytes)"
+        )
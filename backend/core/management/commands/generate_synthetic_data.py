@@ -0,0 +1,218 @@
+import json
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import Chat, Disease, Message
+from core.retention import delete_chats
+from users.models import CustomUser, Profile
+
+EMAIL_DOMAIN = "synthetic.example.com"
+
+DOCTOR_QUESTIONS = (
+    "Что вас беспокоит?",
+    "Как давно появились эти симптомы?",
+    "Есть ли у вас температура?",
+    "Болит ли голова, и если да, то где именно?",
+    "Принимаете ли вы какие-нибудь лекарства?",
+    "Есть ли у вас аллергия?",
+    "Как изменился цвет кожи за последние дни?",
+    "Больно ли, когда я нажимаю здесь?",
+    "Были ли похожие жалобы у родственников?",
+    "Что усиливает или ослабляет боль?",
+)
+PATIENT_ANSWERS = (
+    "Доктор, мне очень плохо уже третий день.",
+    "Началось примерно неделю назад, сначала слабо, потом сильнее.",
+    "Да, вечером поднимается до тридцати восьми.",
+    "Болит в висках и иногда отдает в затылок.",
+    "Только парацетамол, когда совсем невмоготу.",
+    "Нет, аллергии у меня никогда не было.",
+    "Кожа стала бледнее, а под глазами синяки.",
+    "Ой, да, вот тут больно!",
+    "У мамы было что-то похожее, но точно не помню.",
+    "Когда лежу, становится немного легче.",
+)
+SCORE_RANGES = {"easy": (1500, 5000), "medium": (1000, 4500), "hard": (0, 4000)}
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """Let bulk_create keep our own values in auto_now_add fields."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-generate synthetic users, profiles, finished chats and messages for scale "
+        "testing, then recompute points and ranks with set-based updates"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000)
+        parser.add_argument("--chats-per-user", type=int, default=10)
+        parser.add_argument("--messages-per-chat", type=int, default=12)
+        parser.add_argument("--days", type=int, default=365, help="Spread chats over this many days")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument(
+            "--purge", action="store_true", help="Delete previously generated users and their data"
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options["batch_size"]
+        if options["purge"]:
+            deleted = self.timed("purge", self.purge)
+            Profile.recompute_points_and_ranks()
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} synthetic rows"))
+            return
+
+        self.rng = random.Random(options["seed"])
+        self.now = timezone.now()
+        diseases = list(Disease.objects.filter(is_active=True).values_list("name", flat=True))
+        self.diseases = diseases or ["Грипп", "ОРВИ", "Мигрень"]
+
+        started = time.monotonic()
+        user_ids = self.timed("users and profiles", self.create_users, options["users"])
+        chat_count = self.timed(
+            "chats and messages",
+            self.create_chats,
+            user_ids,
+            options["chats_per_user"],
+            options["messages_per_chat"],
+            options["days"],
+        )
+        self.timed("points and ranks", Profile.recompute_points_and_ranks)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated {len(user_ids)} users and {chat_count} chats "
+                f"in {time.monotonic() - started:.1f} s"
+            )
+        )
+
+    def timed(self, label, func, *args):
+        started = time.monotonic()
+        result = func(*args)
+        self.stdout.write(f"  {label}: {time.monotonic() - started:.1f} s")
+        return result
+
+    def _batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield start, min(start + self.batch_size, total)
+
+    def purge(self):
+        """
+        Delete synthetic users in batches of ``batch_size``, their chats first
+        through the retention purge's delete_chats, so no transaction holds
+        the write lock for the whole purge.
+        """
+        users = CustomUser.objects.filter(email__endswith=f"@{EMAIL_DOMAIN}").order_by("pk")
+        deleted = last_id = 0
+        while True:
+            user_ids = list(users.filter(pk__gt=last_id).values_list("pk", flat=True)[: self.batch_size])
+            if not user_ids:
+                self.stdout.write("")
+                return deleted
+            last_id = user_ids[-1]
+            chats = Chat.objects.filter(doctor_id__in=user_ids).order_by("pk")
+            while chat_ids := list(chats.values_list("pk", flat=True)[: self.batch_size]):
+                deleted += delete_chats(chat_ids)
+            # Чатов уже нет: каскад пользователей затрагивает только профили и статистику
+            rows, _ = CustomUser.objects.filter(pk__in=user_ids).delete()
+            deleted += rows
+            self.stdout.write(f"    {deleted} rows deleted", ending="\r")
+
+    def create_users(self, count):
+        # Один хеш на всех: пароль у синтетических пользователей общий
+        password = make_password("synthetic-password")
+        run = uuid.uuid4().hex[:8]
+        user_ids = []
+        for start, end in self._batches(count):
+            with transaction.atomic():
+                # bulk_create не отправляет post_save, профили создаем сами
+                users = CustomUser.objects.bulk_create(
+                    [
+                        CustomUser(
+                            email=f"user-{run}-{index}@{EMAIL_DOMAIN}",
+                            username=f"doctor{index}",
+                            password=password,
+                        )
+                        for index in range(start, end)
+                    ]
+                )
+                Profile.objects.bulk_create([Profile(user=user) for user in users])
+            user_ids.extend(user.pk for user in users)
+        return user_ids
+
+    def create_chats(self, user_ids, chats_per_user, messages_per_chat, days):
+        total = len(user_ids) * chats_per_user
+        span = timedelta(days=days).total_seconds()
+        created = 0
+        with explicit_timestamps(
+            Chat._meta.get_field("start_time"), Message._meta.get_field("timestamp")
+        ):
+            for start, end in self._batches(total):
+                chats = [
+                    self.build_chat(user_ids[index % len(user_ids)], span)
+                    for index in range(start, end)
+                ]
+                with transaction.atomic():
+                    chats = Chat.objects.bulk_create(chats)
+                    messages = [
+                        message
+                        for chat in chats
+                        for message in self.build_messages(chat, messages_per_chat)
+                    ]
+                    Message.objects.bulk_create(messages, batch_size=self.batch_size)
+                created += len(chats)
+                self.stdout.write(f"    {created}/{total} chats", ending="\r")
+        self.stdout.write("")
+        return created
+
+    def build_chat(self, doctor_id, span):
+        rng = self.rng
+        difficulty = rng.choice(("easy", "medium", "hard"))
+        correct = rng.choice(self.diseases)
+        diagnosis = correct if rng.random() < 0.6 else rng.choice(self.diseases)
+        start_time = self.now - timedelta(seconds=rng.uniform(0, span))
+        return Chat(
+            doctor_id=doctor_id,
+            difficulty=difficulty,
+            patient_data=json.dumps({"Имя": "Синтетический пациент", "Возраст": rng.randint(18, 90)}),
+            patient_responses="{}",
+            correct_diagnosis=correct,
+            diagnosis=diagnosis,
+            score=rng.randint(*SCORE_RANGES[difficulty]),
+            feedback="Синтетическая оценка.",
+            is_finished=True,
+            status="finished",
+            start_time=start_time,
+            end_time=start_time + timedelta(minutes=rng.randint(3, 40)),
+        )
+
+    def build_messages(self, chat, count):
+        rng = self.rng
+        count = max(0, int(rng.gauss(count, count / 3)))
+        step = (chat.end_time - chat.start_time) / max(count, 1)
+        return [
+            Message(
+                chat_id=chat.pk,
+                sender="doctor" if index % 2 == 0 else "patient",
+                content=rng.choice(DOCTOR_QUESTIONS if index % 2 == 0 else PATIENT_ANSWERS),
+                timestamp=chat.start_time + step * index,
+            )
+            for index in range(count)
+        ]
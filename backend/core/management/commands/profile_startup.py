@@ -0,0 +1,68 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Что загружает воркер при старте: настройки, приложения и все URL-модули
+BOOT_SCRIPT = "import django; django.setup(); import {urlconf}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Profile worker startup: list the slowest imports (python -X importtime) "
+        "and benchmark boot time, optionally failing above a budget"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=20, help="Number of slowest imports to show")
+        parser.add_argument("--runs", type=int, default=5, help="Boot benchmark repetitions")
+        parser.add_argument(
+            "--budget-ms",
+            type=float,
+            default=None,
+            help="Fail if the median boot time exceeds this many milliseconds",
+        )
+
+    def _boot(self, *flags):
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "backend.settings")}
+        script = BOOT_SCRIPT.format(urlconf=settings.ROOT_URLCONF)
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, *flags, "-c", script],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        elapsed = (time.perf_counter() - started) * 1000
+        if result.returncode != 0:
+            raise CommandError(f"Boot failed:\n{result.stderr}")
+        return elapsed, result.stderr
+
+    def handle(self, *args, **options):
+        _, report = self._boot("-X", "importtime")
+        imports = []
+        for line in report.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            self_us, cumulative_us, name = line[len("import time:") :].split("|")
+            imports.append((int(cumulative_us), int(self_us), name.strip()))
+
+        self.stdout.write(f"{'cumulative ms':>14} {'self ms':>9}  module")
+        for cumulative_us, self_us, name in sorted(imports, reverse=True)[: options["top"]]:
+            self.stdout.write(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+        timings = [self._boot()[0] for _ in range(options["runs"])]
+        median = statistics.median(timings)
+        self.stdout.write(
+            f"\nBoot time over {len(timings)} runs: median {median:.0f} ms, "
+            f"min {min(timings):.0f} ms, max {max(timings):.0f} ms"
+        )
+
+        budget = options["budget_ms"]
+        if budget is not None and median > budget:
+            raise CommandError(f"Median boot time {median:.0f} ms exceeds budget {budget:.0f} ms")
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.retention import POLICIES, enabled_policies, purge
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete abandoned unfinished chats (and, if configured, old finished chats) in small "
+        "batches with pauses. Interrupted runs resume from a checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--policy", choices=list(POLICIES), action="append")
+        parser.add_argument("--batch-size", type=int, default=settings.RETENTION_BATCH_SIZE)
+        parser.add_argument("--pause", type=float, default=settings.RETENTION_PAUSE)
+        parser.add_argument("--max-batches", type=int, default=None)
+        parser.add_argument("--dry-run", action="store_true", help="Only count the chats to delete")
+
+    def handle(self, *args, **options):
+        policies = options["policy"] or enabled_policies()
+        for policy in policies:
+            setting, _ = POLICIES[policy]
+            if getattr(settings, setting) is None:
+                raise CommandError(f"{setting} is not set, the {policy!r} policy is disabled")
+
+        for policy in policies:
+            def report(batch, chats, rows, seconds):
+                rate = rows / seconds if seconds else 0
+                self.stdout.write(
+                    f"  {policy} batch {batch}: {chats} chats, {rows} rows "
+                    f"in {seconds * 1000:.0f} ms ({rate:.0f} rows/s)"
+                )
+
+            chats, rows, seconds = purge(
+                policy,
+                options["batch_size"],
+                options["pause"],
+                options["max_batches"],
+                options["dry_run"],
+                on_batch=report,
+            )
+            verb = "Would delete" if options["dry_run"] else "Deleted"
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{policy}: {verb} {chats} chats / {rows} rows in {seconds:.1f} s "
+                    f"({rows / seconds if seconds else 0:.0f} rows/s including pauses)"
+                )
+            )
@@ -0,0 +1,116 @@
+import logging
+
+from django.conf import settings
+
+from .llm import complete
+from .models import Chat, Message
+from .tasks import run_async
+
+logger = logging.getLogger(__name__)
+
+ROLES = {"doctor": "user", "patient": "assistant"}
+
+
+def _recent_turns():
+    return getattr(settings, "CONVERSATION_RECENT_TURNS", 6)
+
+
+def _summary_batch_turns():
+    return getattr(settings, "CONVERSATION_SUMMARY_BATCH_TURNS", 4)
+
+
+def _message_max_chars():
+    return getattr(settings, "CONVERSATION_MESSAGE_MAX_CHARS", 1000)
+
+
+def _truncate(text):
+    limit = _message_max_chars()
+    if len(text) <= limit:
+        return text
+    return text[:limit] + "…"
+
+
+def build_conversation_messages(chat):
+    """
+    Build the conversation context for the next patient reply.
+
+    The context is the rolling summary of older turns plus the messages that
+    the summary does not cover yet. While the summary is being refreshed in
+    the background, at most ``CONVERSATION_RECENT_TURNS`` plus one summary
+    batch of turns are sent verbatim, so prompt size stays bounded.
+    """
+    limit = 2 * (_recent_turns() + _summary_batch_turns())
+    recent = list(
+        Message.objects.filter(chat=chat, id__gt=chat.summarized_until)
+        .order_by("-id")
+        .values_list("sender", "content")[:limit]
+    )
+    recent.reverse()
+
+    messages = []
+    if chat.conversation_summary:
+        messages.append(
+            {
+                "role": "system",
+                "content": f"Краткое содержание предыдущей беседы с врачом:\n{chat.conversation_summary}",
+            }
+        )
+    for sender, content in recent:
+        messages.append({"role": ROLES.get(sender, "user"), "content": _truncate(content)})
+    return messages
+
+
+def schedule_summary_update(chat):
+    """Queue a summary refresh once enough turns fall outside the verbatim window."""
+    threshold = 2 * (_recent_turns() + _summary_batch_turns())
+    unsummarized = Message.objects.filter(
+        chat=chat, id__gt=chat.summarized_until
+    ).count()
+    if unsummarized >= threshold:
+        run_async(update_conversation_summary, chat.pk)
+
+
+def update_conversation_summary(chat_id):
+    """Fold the oldest unsummarized turns into the chat's rolling summary."""
+    chat = Chat.objects.get(pk=chat_id)
+    keep = 2 * _recent_turns()
+    unsummarized = list(
+        Message.objects.filter(chat=chat, id__gt=chat.summarized_until)
+        .order_by("id")
+        .values_list("id", "sender", "content")
+    )
+    to_summarize = unsummarized[: max(len(unsummarized) - keep, 0)]
+    if not to_summarize:
+        return
+
+    transcript = "\n".join(
+        f"{'Врач' if sender == 'doctor' else 'Пациент'}: {_truncate(content)}"
+        for _, sender, content in to_summarize
+    )
+    prompt = f"""Вы ведете краткий конспект медицинской консультации.
+
+    Текущий конспект:
+    {chat.conversation_summary or "(пусто)"}
+
+    Новые реплики:
+    {transcript}
+
+    Обновите конспект, добавив факты из новых реплик: какие вопросы задал врач и что ответил пациент о симптомах, анамнезе и самочувствии. Пишите кратко, не более 150 слов."""
+
+    response = complete(
+        "conversation_summary",
+        [{"role": "system", "content": prompt}],
+        difficulty=chat.difficulty,
+        chat_id=chat.pk,
+        max_tokens=getattr(settings, "CONVERSATION_SUMMARY_MAX_TOKENS", 300),
+    )
+
+    # Условное обновление: если параллельная задача уже обновила конспект, пропускаем
+    updated = Chat.objects.filter(
+        pk=chat.pk, summarized_until=chat.summarized_until
+    ).update(
+        conversation_summary=response.choices[0].message.content.strip(),
+        summarized_until=to_summarize[-1][0],
+    )
+    if not updated:
+        logger.info(f"Summary for chat {chat.pk} was updated concurrently, skipping")
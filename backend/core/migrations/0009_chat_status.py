@@ -0,0 +1,24 @@
+# Generated by Django 5.1 on 2026-10-19 00:32
+
+from django.db import migrations, models
+
+
+def mark_finished_chats(apps, schema_editor):
+    Chat = apps.get_model('core', 'Chat')
+    Chat.objects.filter(is_finished=True).update(status='finished')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='status',
+            field=models.CharField(choices=[('active', 'Идет'), ('evaluating', 'Оценивается'), ('finished', 'Завершен')], default='active', max_length=20),
+        ),
+        migrations.RunPython(mark_finished_chats, migrations.RunPython.noop),
+    ]
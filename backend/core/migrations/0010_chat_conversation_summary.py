@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-19 00:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_chat_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='conversation_summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='summarized_until',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1 on 2026-10-19 00:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_chat_conversation_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='cached_prompt_tokens',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='completion_tokens',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='llm_calls',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='prompt_tokens',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='system_prompt',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1 on 2026-10-19 00:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_chat_prompt_and_usage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='from_library',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='PatientCase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('disease', models.CharField(max_length=100)),
+                ('difficulty', models.CharField(choices=[('easy', 'Легкий'), ('medium', 'Средний'), ('hard', 'Сложный')], max_length=10)),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('patient_data', models.TextField()),
+                ('patient_responses', models.TextField()),
+                ('times_served', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['disease', 'difficulty'], name='patientcase_key_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='case',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.patientcase'),
+        ),
+    ]
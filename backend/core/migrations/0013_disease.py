@@ -0,0 +1,61 @@
+# Generated by Django 5.1 on 2026-10-19 00:39
+
+from django.db import migrations, models
+
+from core.disease_lists import COMMON_DISEASES, MEDIUM_DISEASES, HARD_DISEASES
+
+SYNONYMS = {
+    'Простуда': ['ОРВИ', 'Острая респираторная вирусная инфекция'],
+    'Гипертония': ['Артериальная гипертензия', 'Гипертоническая болезнь'],
+    'Астма': ['Бронхиальная астма'],
+    'Диабет 2 типа': ['Сахарный диабет 2 типа', 'СД2'],
+    'Язва желудка': ['Язвенная болезнь желудка'],
+    'Аллергия': ['Аллергическая реакция'],
+    'Боковой амиотрофический склероз': ['БАС'],
+    'Рассеянный склероз': ['РС'],
+    'Системная красная волчанка': ['СКВ', 'Волчанка'],
+    'Болезнь Лайма': ['Клещевой боррелиоз', 'Лайм-боррелиоз'],
+    'Гранулематоз с полиангиитом': ['Гранулематоз Вегенера'],
+    'Кистозный фиброз': ['Муковисцидоз'],
+    'Хронический лимфоцитарный лейкоз': ['ХЛЛ'],
+    'Хронический миелоидный лейкоз': ['ХМЛ'],
+    'Острый лимфобластный лейкоз': ['ОЛЛ'],
+    'Острый миелоидный лейкоз': ['ОМЛ'],
+    'Болезнь Ходжкина': ['Лимфома Ходжкина', 'Лимфогранулематоз'],
+    'Незавершенный остеогенез': ['Несовершенный остеогенез'],
+}
+
+
+def load_diseases(apps, schema_editor):
+    Disease = apps.get_model('core', 'Disease')
+    Disease.objects.bulk_create(
+        Disease(name=name, tier=tier, synonyms=SYNONYMS.get(name, []))
+        for tier, names in (
+            ('common', COMMON_DISEASES),
+            ('medium', MEDIUM_DISEASES),
+            ('hard', HARD_DISEASES),
+        )
+        for name in names
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_patientcase'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Disease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('tier', models.CharField(choices=[('common', 'Распространенное'), ('medium', 'Среднее'), ('hard', 'Редкое')], max_length=10)),
+                ('weight', models.FloatField(default=1.0)),
+                ('synonyms', models.JSONField(blank=True, default=list)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.RunPython(load_diseases, migrations.RunPython.noop),
+    ]
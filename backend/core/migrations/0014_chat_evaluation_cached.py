@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-19 00:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_disease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='evaluation_cached',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-19 00:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_chat_evaluation_cached'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1 on 2026-10-19 00:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_date_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatArchive',
+            fields=[
+                ('chat', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='archive', serialize=False, to='core.chat')),
+                ('codec', models.CharField(default='zlib', max_length=10)),
+                ('payload', models.BinaryField()),
+                ('message_count', models.IntegerField()),
+                ('raw_size', models.IntegerField()),
+                ('packed_size', models.IntegerField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='is_archived',
+            field=models.BooleanField(default=False),
+        ),
+    ]
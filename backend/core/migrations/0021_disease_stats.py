@@ -0,0 +1,29 @@
+# Generated by Django 5.1 on 2026-10-19 01:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_retention_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiseaseStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('disease_name', models.CharField(max_length=100)),
+                ('difficulty', models.CharField(max_length=10)),
+                ('games', models.IntegerField(default=0)),
+                ('score_sum', models.BigIntegerField(default=0)),
+                ('correct_diagnoses', models.IntegerField(default=0)),
+                ('turns_sum', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('disease_name', 'difficulty'), name='unique_disease_stats')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-19 01:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_disease_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='evaluation_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,45 @@
+import json
+
+from django.db import migrations, models
+
+
+def fill_archive_message_ranges(apps, schema_editor):
+    from core.archive import CODECS
+
+    ChatArchive = apps.get_model('core', 'ChatArchive')
+    for archive in ChatArchive.objects.filter(message_count__gt=0).iterator(chunk_size=100):
+        _, decompress = CODECS[archive.codec]
+        ids = [message['id'] for message in json.loads(decompress(bytes(archive.payload)))['messages']]
+        if ids:
+            archive.first_message_id, archive.last_message_id = min(ids), max(ids)
+            archive.save(update_fields=['first_message_id', 'last_message_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_idempotencykey_locked_until'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='exportwatermark',
+            old_name='last_id',
+            new_name='position',
+        ),
+        migrations.AddField(
+            model_name='chatarchive',
+            name='first_message_id',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='chatarchive',
+            name='last_message_id',
+            field=models.BigIntegerField(db_index=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['end_time', 'id'], name='chat_end_time_idx'),
+        ),
+        migrations.RunPython(fill_archive_message_ranges, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_end_time(apps, schema_editor):
+    # До атомарного end_game время окончания не записывалось; берем время
+    # последнего сообщения, а без сообщений - время начала игры
+    Chat = apps.get_model('core', 'Chat')
+    Message = apps.get_model('core', 'Message')
+    last_message = (
+        Message.objects.filter(chat_id=OuterRef('pk'))
+        .values('chat_id')
+        .annotate(last=Max('timestamp'))
+        .values('last')
+    )
+    Chat.objects.filter(is_finished=True, end_time__isnull=True).update(
+        end_time=Coalesce(Subquery(last_message), 'start_time')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_export_cursors'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_end_time, migrations.RunPython.noop),
+    ]
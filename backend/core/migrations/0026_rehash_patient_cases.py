@@ -0,0 +1,28 @@
+import json
+
+from django.db import migrations
+
+
+def rehash_cases(apps, schema_editor):
+    from core.case_library import content_hash
+
+    PatientCase = apps.get_model('core', 'PatientCase')
+    for case in PatientCase.objects.iterator(chunk_size=500):
+        case.content_hash = content_hash(
+            case.disease,
+            case.difficulty,
+            json.loads(case.patient_data),
+            json.loads(case.patient_responses),
+        )
+        case.save(update_fields=['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_backfill_chat_end_time'),
+    ]
+
+    operations = [
+        migrations.RunPython(rehash_cases, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,38 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
 from users.models import CustomUser
 
 
+class Disease(models.Model):
+    TIER_CHOICES = [
+        ('common', 'Распространенное'),
+        ('medium', 'Среднее'),
+        ('hard', 'Редкое'),
+    ]
+
+    name = models.CharField(max_length=100, unique=True)
+    tier = models.CharField(max_length=10, choices=TIER_CHOICES)
+    weight = models.FloatField(default=1.0)
+    synonyms = models.JSONField(default=list, blank=True)
+    is_active = models.BooleanField(default=True)
+
+    def __str__(self):
+        return self.name
+
+
 class Chat(models.Model):
     DIFFICULTY_CHOICES = [
         ('easy', 'Легкий'),
         ('medium', 'Средний'),
         ('hard', 'Сложный'),
     ]
+    STATUS_CHOICES = [
+        ('active', 'Идет'),
+        ('evaluating', 'Оценивается'),
+        ('finished', 'Завершен'),
+    ]
     
     doctor = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     patient_data = models.TextField()
@@ -19,8 +44,43 @@ class Chat(models.Model):
     score = models.IntegerField(null=True, blank=True)
     feedback = models.TextField(null=True, blank=True)
     is_finished = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    evaluation_started_at = models.DateTimeField(null=True, blank=True)
+    conversation_summary = models.TextField(blank=True, default='')
+    summarized_until = models.BigIntegerField(default=0)
+    system_prompt = models.TextField(blank=True, default='')
+    llm_calls = models.IntegerField(default=0)
+    prompt_tokens = models.IntegerField(default=0)
+    cached_prompt_tokens = models.IntegerField(default=0)
+    completion_tokens = models.IntegerField(default=0)
+    case = models.ForeignKey('PatientCase', on_delete=models.SET_NULL, null=True, blank=True)
+    from_library = models.BooleanField(default=False)
+    evaluation_cached = models.BooleanField(default=False)
+    version = models.IntegerField(default=0)
+    is_archived = models.BooleanField(default=False)
     difficulty = models.CharField(max_length=10, choices=DIFFICULTY_CHOICES, default='easy')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['start_time'], name='chat_start_time_idx'),
+            models.Index(fields=['end_time', 'id'], name='chat_end_time_idx'),
+        ]
+
+
+
+class PatientCase(models.Model):
+    disease = models.CharField(max_length=100)
+    difficulty = models.CharField(max_length=10, choices=Chat.DIFFICULTY_CHOICES)
+    content_hash = models.CharField(max_length=64, unique=True)
+    patient_data = models.TextField()
+    patient_responses = models.TextField()
+    times_served = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['disease', 'difficulty'], name='patientcase_key_idx'),
+        ]
 
 
 class Message(models.Model):
@@ -28,3 +88,97 @@ class Message(models.Model):
     sender = models.CharField(max_length=10)
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp'], name='message_timestamp_idx'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    STATUS_CHOICES = [
+        ('in_progress', 'В процессе'),
+        ('completed', 'Завершен'),
+    ]
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    endpoint = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='in_progress')
+    response_status = models.IntegerField(null=True, blank=True)
+    response_body = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    # Пока запрос выполняется, ключ за ним; после этого срока его может забрать повтор
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+
+    @classmethod
+    def purge_expired(cls):
+        deleted, _ = cls.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+
+class ChatArchive(models.Model):
+    """Compressed transcript of a finished chat whose Message rows were removed."""
+
+    chat = models.OneToOneField(Chat, on_delete=models.CASCADE, primary_key=True, related_name='archive')
+    codec = models.CharField(max_length=10, default='zlib')
+    payload = models.BinaryField()
+    message_count = models.IntegerField()
+    # Диапазон id архивных сообщений, чтобы выгрузка не распаковывала лишние архивы
+    first_message_id = models.BigIntegerField(null=True)
+    last_message_id = models.BigIntegerField(null=True, db_index=True)
+    raw_size = models.IntegerField()
+    packed_size = models.IntegerField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+
+class ExportWatermark(models.Model):
+    """Last exported cursor position of a named incremental export."""
+
+    name = models.CharField(max_length=100, unique=True)
+    dataset = models.CharField(max_length=20)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class RetentionCheckpoint(models.Model):
+    """Last chat id handled by an interrupted retention purge, per policy."""
+
+    policy = models.CharField(max_length=20, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class DiseaseStats(models.Model):
+    """Running totals of finished games per disease and difficulty."""
+
+    disease_name = models.CharField(max_length=100)
+    difficulty = models.CharField(max_length=10)
+    games = models.IntegerField(default=0)
+    score_sum = models.BigIntegerField(default=0)
+    correct_diagnoses = models.IntegerField(default=0)
+    turns_sum = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['disease_name', 'difficulty'], name='unique_disease_stats'),
+        ]
+
+    @property
+    def success_rate(self):
+        return self.correct_diagnoses / self.games if self.games else None
+
+
+@receiver(post_save, sender=Disease)
+@receiver(post_delete, sender=Disease)
+def invalidate_disease_catalog(sender, **kwargs):
+    from .sampling import bump_catalog_version
+
+    bump_catalog_version()
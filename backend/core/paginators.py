@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Max
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never runs an unbounded COUNT(*).
+
+    An unfiltered table is sized by its largest primary key (one index
+    lookup; deleted rows make it an overestimate). A filtered queryset is
+    counted only up to ADMIN_COUNT_LIMIT rows, so the last reachable page is
+    capped there.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            return queryset.model._default_manager.aggregate(top=Max("pk"))["top"] or 0
+        return queryset.order_by()[: settings.ADMIN_COUNT_LIMIT].count()
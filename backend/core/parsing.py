@@ -0,0 +1,213 @@
+import json
+import logging
+import re
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from .llm import complete, select_model
+
+logger = logging.getLogger(__name__)
+
+
+class StructuredOutputError(Exception):
+    """The model output could not be parsed even after local repair and retries."""
+
+
+PATIENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "patient_data": {"type": "object"},
+        "patient_responses": {"type": "object"},
+    },
+    "required": ["patient_data", "patient_responses"],
+}
+
+EVALUATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "integer", "minimum": 0, "maximum": 5000},
+        "feedback": {"type": "string"},
+    },
+    "required": ["score", "feedback"],
+    "additionalProperties": False,
+}
+
+QUALITATIVE_EVALUATION_SCHEMA = {
+    **EVALUATION_SCHEMA,
+    "properties": {
+        "score": {"type": "integer", "minimum": 0, "maximum": 3000},
+        "feedback": {"type": "string"},
+    },
+}
+
+_CODE_FENCE = re.compile(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$")
+_NUMBER = re.compile(r"-?\d[\d\s ]*")
+
+
+class ParseStats:
+    def __init__(self):
+        self._counts = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    def record(self, call_site, outcome):
+        with self._lock:
+            self._counts[call_site][outcome] += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = {site: dict(counter) for site, counter in self._counts.items()}
+        report = {}
+        for site, counter in counts.items():
+            total = sum(counter.values())
+            report[site] = {
+                **counter,
+                "repair_rate": round(counter.get("repaired", 0) / total, 3),
+                "failure_rate": round(counter.get("failed", 0) / total, 3),
+            }
+        return report
+
+
+parse_stats = ParseStats()
+
+
+def extract_json_object(text):
+    """Return the outermost JSON object in text, ignoring code fences and chatter."""
+    text = _CODE_FENCE.sub("", text.strip())
+    start = text.find("{")
+    if start == -1:
+        raise ValueError("No JSON object in model output")
+
+    depth = 0
+    in_string = False
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return json.loads(text[start : index + 1])
+    raise ValueError("Unterminated JSON object in model output")
+
+
+def parse_points(value, minimum=0, maximum=5000):
+    """Coerce ``4500``, ``"4500"``, ``"4 500 баллов"`` or ``"4500/5000"`` to a clamped int."""
+    if isinstance(value, bool):
+        raise ValueError("Boolean is not a score")
+    if isinstance(value, (int, float)):
+        number = int(value)
+    else:
+        match = _NUMBER.search(str(value))
+        if match is None:
+            raise ValueError(f"No number in {value!r}")
+        number = int(re.sub(r"\s", "", match.group()))
+    return max(minimum, min(maximum, number))
+
+
+def validate_patient(data):
+    for key in ("patient_data", "patient_responses"):
+        value = data.get(key)
+        if isinstance(value, str):
+            value = json.loads(value)
+        if not isinstance(value, (dict, list)) or not value:
+            raise ValueError(f"'{key}' must be a non-empty object")
+        data[key] = value
+    return data
+
+
+def validate_evaluation(data):
+    if "score" not in data or not isinstance(data.get("feedback"), str):
+        raise ValueError("Evaluation must contain 'score' and 'feedback'")
+    return {"score": parse_points(data["score"]), "feedback": data["feedback"].strip()}
+
+
+def validate_qualitative_evaluation(data):
+    evaluation = validate_evaluation(data)
+    evaluation["score"] = min(evaluation["score"], 3000)
+    return evaluation
+
+
+def parse_legacy_evaluation(text):
+    """Parse the old ``Оценка: ... Обратная связь: ...`` plain-text format."""
+    score_line = next(
+        line for line in text.split("\n") if line.strip().startswith("Оценка:")
+    )
+    feedback = text.split("Обратная связь:")[1].strip()
+    return {"score": parse_points(score_line.split(":", 1)[1]), "feedback": feedback}
+
+
+def parse_output(text, validator, fallback=None):
+    """
+    Parse model output into validated data.
+
+    Returns ``(data, repaired)``; ``repaired`` is True when the raw output was
+    not valid JSON as-is and had to be fixed locally.
+    """
+    try:
+        return validator(json.loads(text)), False
+    except (ValueError, TypeError, AttributeError):
+        pass
+
+    try:
+        return validator(extract_json_object(text)), True
+    except (ValueError, TypeError, AttributeError):
+        if fallback is None:
+            raise
+    # Результат старого формата проходит ту же проверку, включая потолок баллов
+    try:
+        return validator(fallback(text)), True
+    except (ValueError, TypeError, AttributeError, IndexError, StopIteration) as exc:
+        raise ValueError(str(exc)) from exc
+
+
+def _response_format(model, schema_name, schema):
+    if model in settings.LLM_JSON_SCHEMA_MODELS:
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": schema_name, "schema": schema},
+        }
+    return {"type": "json_object"}
+
+
+def complete_structured(
+    call_site, messages, schema_name, schema, validator, fallback=None, **kwargs
+):
+    """
+    Request schema-constrained output and parse it, repairing near misses locally.
+
+    A new request is made only when local repair fails, at most
+    ``LLM_STRUCTURED_MAX_RETRIES`` times.
+    """
+    model = select_model(call_site, kwargs.get("difficulty"))
+    response_format = _response_format(model, schema_name, schema)
+
+    attempts = 1 + settings.LLM_STRUCTURED_MAX_RETRIES
+    for attempt in range(attempts):
+        response = complete(
+            call_site, messages, response_format=response_format, **kwargs
+        )
+        text = response.choices[0].message.content or ""
+        try:
+            data, repaired = parse_output(text, validator, fallback)
+        except (ValueError, TypeError, AttributeError) as exc:
+            parse_stats.record(call_site, "failed")
+            logger.warning(
+                f"Unparseable {call_site} output (attempt {attempt + 1}/{attempts}): {exc}"
+            )
+            continue
+        parse_stats.record(call_site, "repaired" if repaired else "ok")
+        return data
+
+    raise StructuredOutputError(f"Could not parse {call_site} output")
@@ -0,0 +1,56 @@
+import json
+
+from .models import Chat
+
+RESPONSE_STYLES = {
+    "easy": "Отвечайте точно и подробно на вопросы врача.",
+    "medium": "Отвечайте достаточно точно, но можете иногда упускать некоторые детали или немного путаться.",
+    "hard": "Отвечайте неточно, путайтесь в описаниях и иногда жалуйтесь на симптомы, не связанные с вашим основным заболеванием.",
+}
+
+PATIENT_PROMPT_TEMPLATE = """Вы - виртуальный пациент со следующими данными:
+{patient_data}
+
+У вас есть следующие предварительно подготовленные ответы:
+{patient_responses}
+
+{response_style}
+
+Если вопрос врача соответствует одному из предварительно подготовленных ответов, используйте его как основу, но адаптируйте под конкретный вопрос. Если вопрос новый, ответьте на него, исходя из данных пациента и стиля ответа.
+
+Отвечайте на вопросы врача от лица пациента."""
+
+
+def compact_json(data):
+    """Serialize data for a prompt: no indentation, sorted keys, raw Cyrillic."""
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def render_patient_prompt(chat):
+    return PATIENT_PROMPT_TEMPLATE.format(
+        patient_data=compact_json(json.loads(chat.patient_data)),
+        patient_responses=compact_json(json.loads(chat.patient_responses)),
+        response_style=RESPONSE_STYLES.get(chat.difficulty, RESPONSE_STYLES["hard"]),
+    )
+
+
+def get_patient_system_prompt(chat):
+    """
+    Return the chat's static system prefix, rendering and storing it once.
+
+    The prefix depends only on the patient case and difficulty, so it is
+    byte-identical on every turn and the provider can cache it.
+    """
+    if not chat.system_prompt:
+        chat.system_prompt = render_patient_prompt(chat)
+        Chat.objects.filter(pk=chat.pk).update(system_prompt=chat.system_prompt)
+    return chat.system_prompt
+
+
+def build_patient_messages(chat, history, doctor_message):
+    """Static prefix first, then the conversation context, then the new question."""
+    return [
+        {"role": "system", "content": get_patient_system_prompt(chat)},
+        *history,
+        {"role": "user", "content": doctor_message},
+    ]
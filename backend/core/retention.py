@@ -0,0 +1,88 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Chat, ChatArchive, Message, RetentionCheckpoint
+
+
+def abandoned_chats(now):
+    """Unfinished games with no message for RETENTION_ABANDONED_CHAT_DAYS."""
+    cutoff = now - timedelta(days=settings.RETENTION_ABANDONED_CHAT_DAYS)
+    recent = Message.objects.filter(chat_id=OuterRef("pk"), timestamp__gte=cutoff)
+    # "evaluating" здесь - только брошенные захваты: оценка идет секунды, а не дни
+    return Chat.objects.filter(
+        is_finished=False, status__in=("active", "evaluating"), start_time__lt=cutoff
+    ).exclude(Exists(recent))
+
+
+def finished_chats(now):
+    cutoff = now - timedelta(days=settings.RETENTION_FINISHED_CHAT_DAYS)
+    return Chat.objects.filter(is_finished=True, end_time__lt=cutoff)
+
+
+POLICIES = {
+    "abandoned": ("RETENTION_ABANDONED_CHAT_DAYS", abandoned_chats),
+    "finished": ("RETENTION_FINISHED_CHAT_DAYS", finished_chats),
+}
+
+
+def enabled_policies():
+    return [name for name, (setting, _) in POLICIES.items() if getattr(settings, setting) is not None]
+
+
+def delete_chats(chat_ids):
+    """Delete chats with their messages and archives; returns the number of rows removed."""
+    with transaction.atomic():
+        # Сначала зависимые строки одним DELETE, чтобы каскад Chat ничего не выбирал
+        messages, _ = Message.objects.filter(chat_id__in=chat_ids).delete()
+        archives, _ = ChatArchive.objects.filter(chat_id__in=chat_ids).delete()
+        chats, _ = Chat.objects.filter(pk__in=chat_ids).delete()
+    return messages + archives + chats
+
+
+def purge(policy, batch_size, pause, max_batches=None, dry_run=False, on_batch=None):
+    """
+    Delete the policy's chats in primary-key order, ``batch_size`` chats per
+    short transaction with ``pause`` seconds between them, so live games only
+    ever wait for one small batch.
+
+    Progress is checkpointed after every batch; an interrupted purge resumes
+    from the checkpoint, and a completed one resets it. Returns
+    ``(chats, rows, seconds)``.
+    """
+    _, candidates = POLICIES[policy]
+    checkpoint, _ = RetentionCheckpoint.objects.get_or_create(policy=policy)
+    now = timezone.now()
+    last_id = checkpoint.last_id
+    chats = rows = batches = 0
+    started = time.monotonic()
+
+    while max_batches is None or batches < max_batches:
+        chat_ids = list(
+            candidates(now)
+            .filter(pk__gt=last_id)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not chat_ids:
+            last_id = 0
+            break
+        batch_started = time.monotonic()
+        removed = 0 if dry_run else delete_chats(chat_ids)
+        last_id = chat_ids[-1]
+        if not dry_run:
+            RetentionCheckpoint.objects.filter(pk=checkpoint.pk).update(last_id=last_id)
+        batches += 1
+        chats += len(chat_ids)
+        rows += removed
+        if on_batch is not None:
+            on_batch(batches, len(chat_ids), removed, time.monotonic() - batch_started)
+        time.sleep(pause)
+
+    if not dry_run:
+        RetentionCheckpoint.objects.filter(pk=checkpoint.pk).update(last_id=last_id)
+    return chats, rows, time.monotonic() - started
@@ -0,0 +1,214 @@
+import math
+import random
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Chat, Disease, DiseaseStats
+from .tasks import run_async
+
+CATALOG_VERSION_KEY = "disease-catalog-version"
+
+# Уровни сложности и какие группы болезней в них входят
+DIFFICULTY_TIERS = {
+    "easy": ("common",),
+    "medium": ("common", "medium"),
+    "hard": ("common", "medium", "hard"),
+}
+
+
+class AliasTable:
+    """Walker/Vose alias table: O(n) to build, O(1) per weighted sample."""
+
+    def __init__(self, items, weights):
+        if not items:
+            raise ValueError("Cannot sample from an empty catalog")
+        count = len(items)
+        total = float(sum(weights))
+        scaled = [weight * count / total for weight in weights]
+        self.items = list(items)
+        self.prob = [0.0] * count
+        self.alias = [0] * count
+
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+        for index in small + large:
+            self.prob[index] = 1.0
+
+    def sample(self, rng=random):
+        index = rng.randrange(len(self.items))
+        if rng.random() < self.prob[index]:
+            return self.items[index]
+        return self.items[self.alias[index]]
+
+
+def adaptive_factor(stats, difficulty):
+    """
+    Weight multiplier favouring diseases whose observed success rate at this
+    difficulty is close to DISEASE_TARGET_SUCCESS_RATE.
+
+    The rate is smoothed towards the target with DISEASE_ADAPTIVE_PRIOR_GAMES
+    pseudo-games, so diseases with few games stay near 1.0; no disease drops
+    below DISEASE_ADAPTIVE_MIN_FACTOR.
+    """
+    if stats is None:
+        return 1.0
+    target = settings.DISEASE_TARGET_SUCCESS_RATE[difficulty]
+    prior = settings.DISEASE_ADAPTIVE_PRIOR_GAMES
+    rate = (stats.correct_diagnoses + prior * target) / (stats.games + prior)
+    distance = (rate - target) / settings.DISEASE_ADAPTIVE_BANDWIDTH
+    return max(settings.DISEASE_ADAPTIVE_MIN_FACTOR, math.exp(-distance * distance))
+
+
+class DiseaseCatalog:
+    """
+    In-process copy of the active disease catalog with per-difficulty alias tables.
+
+    Tables are rebuilt when the shared catalog version changes, which happens
+    whenever a Disease row is saved or deleted. With adaptive selection on,
+    they are also rebuilt from DiseaseStats every DISEASE_ADAPTIVE_REFRESH
+    seconds on the background pool, so sampling never waits for it.
+    """
+
+    def __init__(self):
+        self.version = None
+        self._lock = threading.Lock()
+        self.diseases = []
+        self.by_id = {}
+        self.by_name = {}
+        self.tables = {}
+        self.built_at = 0.0
+        self._rebuild_scheduled_at = 0.0
+
+    def refresh(self):
+        version = cache.get(CATALOG_VERSION_KEY)
+        if version is None:
+            cache.add(CATALOG_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+            version = cache.get(CATALOG_VERSION_KEY)
+        if version == self.version:
+            self._schedule_adaptive_rebuild()
+            return self
+        with self._lock:
+            if version != self.version:
+                self._build()
+                self.version = version
+        return self
+
+    def _schedule_adaptive_rebuild(self):
+        now = time.monotonic()
+        refresh = settings.DISEASE_ADAPTIVE_REFRESH
+        # Повторно планируем, только если прошлый запуск так и не состоялся
+        if (
+            not settings.DISEASE_ADAPTIVE_SELECTION
+            or now - self.built_at < refresh
+            or now - self._rebuild_scheduled_at < refresh
+        ):
+            return
+        self._rebuild_scheduled_at = now
+        run_async(self._adaptive_rebuild)
+
+    def _adaptive_rebuild(self):
+        with self._lock:
+            self._build()
+
+    def _build(self):
+        diseases = list(Disease.objects.filter(is_active=True).order_by("id"))
+        stats = {}
+        if settings.DISEASE_ADAPTIVE_SELECTION:
+            stats = {
+                (row.disease_name, row.difficulty): row
+                for row in DiseaseStats.objects.filter(
+                    games__gte=settings.DISEASE_ADAPTIVE_MIN_GAMES
+                )
+            }
+        tables = {}
+        for difficulty, tiers in DIFFICULTY_TIERS.items():
+            pool = [d for d in diseases if d.tier in tiers and d.weight > 0]
+            if pool:
+                weights = [d.weight for d in pool]
+                if settings.DISEASE_ADAPTIVE_SELECTION:
+                    weights = [
+                        weight * adaptive_factor(stats.get((d.name, difficulty)), difficulty)
+                        for d, weight in zip(pool, weights)
+                    ]
+                tables[difficulty] = AliasTable(pool, weights)
+        self.diseases = diseases
+        self.by_id = {disease.id: disease for disease in diseases}
+        self.by_name = {disease.name: disease for disease in diseases}
+        self.tables = tables
+        self.built_at = time.monotonic()
+
+    def sample(self, difficulty, exclude=0):
+        """
+        Draw a disease for the difficulty, skipping ids whose bit is set in ``exclude``.
+
+        Rejection sampling keeps draws O(1) while the excluded probability mass
+        is small; after a bounded number of rejections the last draw is used.
+        """
+        self.refresh()
+        table = self.tables.get(difficulty) or self.tables["hard"]
+        disease = table.sample()
+        for _ in range(settings.DISEASE_SAMPLING_MAX_REJECTIONS):
+            if not (exclude >> disease.id) & 1:
+                break
+            disease = table.sample()
+        return disease
+
+
+catalog = DiseaseCatalog()
+
+
+def bump_catalog_version():
+    cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def _history_key(user_id):
+    return f"recent-diseases:{user_id}"
+
+
+def recent_history(user):
+    """Return ``(ids, bitset)`` of the diseases the user played most recently."""
+    history = cache.get(_history_key(user.pk))
+    if history is None:
+        catalog.refresh()
+        names = Chat.objects.filter(doctor=user).order_by("-id").values_list(
+            "correct_diagnosis", flat=True
+        )[: settings.DISEASE_RECENT_HISTORY_SIZE]
+        ids = [catalog.by_name[name].id for name in names if name in catalog.by_name]
+        history = (ids, _bitset(ids))
+        cache.set(_history_key(user.pk), history, settings.DISEASE_RECENT_HISTORY_TTL)
+    return history
+
+
+def remember_disease(user, disease):
+    ids, _ = recent_history(user)
+    ids = [disease.id] + [i for i in ids if i != disease.id]
+    ids = ids[: settings.DISEASE_RECENT_HISTORY_SIZE]
+    cache.set(
+        _history_key(user.pk), (ids, _bitset(ids)), settings.DISEASE_RECENT_HISTORY_TTL
+    )
+
+
+def _bitset(ids):
+    mask = 0
+    for disease_id in ids:
+        mask |= 1 << disease_id
+    return mask
+
+
+def sample_disease(difficulty, user=None):
+    if user is None:
+        return catalog.sample(difficulty)
+    _, exclude = recent_history(user)
+    disease = catalog.sample(difficulty, exclude)
+    remember_disease(user, disease)
+    return disease
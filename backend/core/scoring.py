@@ -0,0 +1,166 @@
+import re
+
+from django.conf import settings
+
+from .autocomplete import get_index, normalize, trigrams
+
+_DIGITS = re.compile(r"\d+")
+
+DIAGNOSIS_POINTS = 2000
+QUALITATIVE_POINTS = 3000
+
+# Ключевые слова для офлайн-оценки вопросов врача
+SYMPTOM_KEYWORDS = (
+    "симптом", "жалоб", "беспоко", "болит", "боль", "температур",
+    "кашель", "тошнот", "слабост", "когда", "как долго", "давно",
+)
+APPEARANCE_KEYWORDS = (
+    "внешн", "выгляд", "кож", "цвет", "сып", "отек", "покраснен", "бледн", "глаз",
+)
+TACTILE_KEYWORDS = (
+    "касани", "давлен", "нажат", "пальпац", "трога", "прикоснов", "ощуща",
+)
+HISTORY_KEYWORDS = (
+    "аллерг", "хроническ", "лекарств", "препарат", "наследств",
+    "родствен", "операци", "прививк",
+)
+
+
+def similarity(first, second):
+    """Dice coefficient over character trigrams of two normalized strings."""
+    first_grams, second_grams = trigrams(first), trigrams(second)
+    if not first_grams or not second_grams:
+        return 0.0
+    return 2 * len(first_grams & second_grams) / (len(first_grams) + len(second_grams))
+
+
+def edit_distance(first, second):
+    """Levenshtein distance, counting a swap of adjacent letters as one edit."""
+    previous2, previous = None, list(range(len(second) + 1))
+    for i, first_char in enumerate(first, 1):
+        current = [i]
+        for j, second_char in enumerate(second, 1):
+            cost = first_char != second_char
+            best = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (
+                i > 1
+                and j > 1
+                and first_char == second[j - 2]
+                and first[i - 2] == second_char
+            ):
+                best = min(best, previous2[j - 2] + 1)
+            current.append(best)
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def is_misspelling(answer, alias):
+    """
+    A few edits away from ``alias``: one per DIAGNOSIS_TYPO_CHARS_PER_EDIT letters.
+
+    Trigram similarity punishes a single typo hard in a short name ("грип"
+    shares few trigrams with "грипп"), so short names are matched this way.
+    Numbers must match exactly: "диабет 1 типа" is not a typo of "диабет 2 типа".
+    """
+    if len(alias) < settings.DIAGNOSIS_TYPO_MIN_LENGTH:
+        return False
+    if _DIGITS.findall(answer) != _DIGITS.findall(alias):
+        return False
+    allowed = max(1, len(alias) // settings.DIAGNOSIS_TYPO_CHARS_PER_EDIT)
+    return abs(len(answer) - len(alias)) <= allowed and edit_distance(answer, alias) <= allowed
+
+
+def _aliases(name):
+    return get_index().aliases.get(name) or [normalize(name)]
+
+
+def score_diagnosis(correct_diagnosis, answer):
+    """
+    Score the "Точность диагноза" criterion (0-2000) without the LLM.
+
+    Exact and synonym matches get full points, near-identical spellings (by
+    trigram similarity or a small edit distance) get full points too, answers
+    naming a different catalog disease or sharing almost nothing with the
+    correct one get zero, and the rest is scaled by trigram similarity.
+    """
+    answer = normalize(answer or "")
+    if not answer:
+        return {"points": 0, "match": "empty", "comment": "Диагноз не указан."}
+
+    aliases = _aliases(correct_diagnosis)
+    if answer in aliases:
+        return {
+            "points": DIAGNOSIS_POINTS,
+            "match": "exact",
+            "comment": "Диагноз поставлен верно.",
+        }
+
+    # Ответ точно называет другую болезнь из каталога
+    other = get_index().by_alias.get(answer)
+    names_other = other is not None and other != correct_diagnosis
+
+    best = max(similarity(answer, alias) for alias in aliases)
+    if not names_other and (
+        best >= settings.DIAGNOSIS_FUZZY_MATCH_THRESHOLD
+        or any(is_misspelling(answer, alias) for alias in aliases)
+    ):
+        return {
+            "points": DIAGNOSIS_POINTS,
+            "match": "fuzzy",
+            "comment": "Диагноз поставлен верно (с неточностью в написании).",
+        }
+
+    if best < settings.DIAGNOSIS_UNRELATED_THRESHOLD or (
+        names_other and best < settings.DIAGNOSIS_RELATED_THRESHOLD
+    ):
+        return {
+            "points": 0,
+            "match": "wrong",
+            "comment": f"Диагноз неверный, правильный диагноз: {correct_diagnosis}.",
+        }
+
+    span = settings.DIAGNOSIS_FUZZY_MATCH_THRESHOLD - settings.DIAGNOSIS_UNRELATED_THRESHOLD
+    share = (best - settings.DIAGNOSIS_UNRELATED_THRESHOLD) / span
+    return {
+        "points": int(DIAGNOSIS_POINTS * share),
+        "match": "partial",
+        "comment": f"Диагноз частично верный, правильный диагноз: {correct_diagnosis}.",
+    }
+
+
+def is_correct_diagnosis(correct_diagnosis, answer):
+    """Exact, synonym or near-identical spelling of the correct diagnosis."""
+    return score_diagnosis(correct_diagnosis, answer)["match"] in ("exact", "fuzzy")
+
+
+def _count_matching(questions, keywords):
+    return sum(1 for question in questions if any(k in question for k in keywords))
+
+
+def score_questions_offline(doctor_questions):
+    """Heuristic score of the qualitative criteria (0-3000) from question keywords."""
+    questions = [question.casefold().replace("ё", "е") for question in doctor_questions]
+    symptoms = _count_matching(questions, SYMPTOM_KEYWORDS)
+    appearance = _count_matching(questions, APPEARANCE_KEYWORDS)
+    tactile = _count_matching(questions, TACTILE_KEYWORDS)
+    history = _count_matching(questions, HISTORY_KEYWORDS)
+
+    parts = {
+        "Качество сбора информации о симптомах": (
+            min(1000, 250 * symptoms + 150 * history),
+            1000,
+        ),
+        "Вопросы о внешнем виде пациента": (min(500, 250 * appearance), 500),
+        "Вопросы о тактильных ощущениях": (min(500, 250 * tactile), 500),
+        "Общий подход и логика": (
+            min(1000, 100 * len(questions) + 200 * bool(history)),
+            1000,
+        ),
+    }
+    feedback = "\n".join(
+        f"{title}: {points}/{maximum}" for title, (points, maximum) in parts.items()
+    )
+    return {
+        "score": sum(points for points, _ in parts.values()),
+        "feedback": f"{feedback}\n(Автоматическая оценка без эксперта.)",
+    }
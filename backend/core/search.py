@@ -0,0 +1,178 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Chat, Message
+
+# FTS5-таблицы с внешним содержимым: текст хранится только в core_message и
+# core_chat, индекс поддерживают триггеры
+FTS_TABLES = {
+    "core_message_fts": ("core_message", ("content",)),
+    "core_chat_fts": ("core_chat", ("diagnosis", "correct_diagnosis")),
+}
+
+_WORD = re.compile(r"\w+")
+
+
+def is_available(using=connection):
+    return using.vendor == "sqlite"
+
+
+def _index_statements(fts_table, table, columns):
+    names = ", ".join(columns)
+    new = ", ".join(f"new.{column}" for column in columns)
+    old = ", ".join(f"old.{column}" for column in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+        f"{names}, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts_table}(rowid, {names}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {names}) "
+        f"VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {names} ON {table} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {names}) "
+        f"VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts_table}(rowid, {names}) VALUES (new.id, {new}); END",
+    ]
+
+
+def ensure_search_index(using=connection):
+    """
+    Create the FTS5 tables and their sync triggers if they are missing.
+
+    SQLite migrations that rebuild core_message or core_chat drop the
+    triggers, so this also runs after every migrate.
+    """
+    if not is_available(using):
+        return
+    existing = set(using.introspection.table_names())
+    with using.cursor() as cursor:
+        for fts_table, (table, columns) in FTS_TABLES.items():
+            if table not in existing:
+                continue
+            for statement in _index_statements(fts_table, table, columns):
+                cursor.execute(statement)
+
+
+def drop_search_index(using=connection):
+    if not is_available(using):
+        return
+    with using.cursor() as cursor:
+        for fts_table in FTS_TABLES:
+            for suffix in ("ai", "ad", "au"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {fts_table}_{suffix}")
+            cursor.execute(f"DROP TABLE IF EXISTS {fts_table}")
+
+
+def rebuild_search_index(using=connection):
+    if not is_available(using):
+        return
+    with using.cursor() as cursor:
+        for fts_table in FTS_TABLES:
+            cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+
+
+def match_expression(text):
+    """
+    Turn free user input into an FTS5 query: every word must match, as a prefix.
+
+    Words are quoted, so FTS5 operators and punctuation in the input are inert.
+    """
+    words = _WORD.findall(text.casefold())
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def _matching_ids(fts_table, expression):
+    return RawSQL(f"SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH %s", [expression])
+
+
+def filter_messages(queryset, text):
+    """Restrict a Message queryset to full-text matches of ``text``."""
+    expression = match_expression(text)
+    if expression is None:
+        return queryset
+    if not is_available():
+        return queryset.filter(content__icontains=text)
+    return queryset.filter(pk__in=_matching_ids("core_message_fts", expression))
+
+
+def filter_chats(queryset, text):
+    """Restrict a Chat queryset to full-text matches of ``text`` in either diagnosis."""
+    expression = match_expression(text)
+    if expression is None:
+        return queryset
+    if not is_available():
+        return queryset.filter(
+            Q(diagnosis__icontains=text) | Q(correct_diagnosis__icontains=text)
+        )
+    return queryset.filter(pk__in=_matching_ids("core_chat_fts", expression))
+
+
+SEARCH_SQL = {
+    "messages": (
+        "core_message_fts",
+        "SELECT m.id, m.chat_id, m.sender, m.timestamp, "
+        "snippet(core_message_fts, 0, '[', ']', '…', 16), bm25(core_message_fts) "
+        "FROM core_message_fts JOIN core_message m ON m.id = core_message_fts.rowid "
+        "WHERE core_message_fts MATCH %s ORDER BY {order} LIMIT %s OFFSET %s",
+        ("id", "chat", "sender", "timestamp", "snippet", "score"),
+    ),
+    "chats": (
+        "core_chat_fts",
+        "SELECT c.id, c.doctor_id, c.diagnosis, c.correct_diagnosis, c.start_time, "
+        "bm25(core_chat_fts) "
+        "FROM core_chat_fts JOIN core_chat c ON c.id = core_chat_fts.rowid "
+        "WHERE core_chat_fts MATCH %s ORDER BY {order} LIMIT %s OFFSET %s",
+        ("id", "doctor", "diagnosis", "correct_diagnosis", "start_time", "score"),
+    ),
+}
+
+# "rank" считает bm25 для всех совпадений, "recent" идет по rowid индекса
+ORDERINGS = {"rank": "{table}.rank", "recent": "{table}.rowid DESC"}
+
+
+def search(scope, text, page=1, page_size=20, order="rank"):
+    """
+    Ranked full-text search over messages or chats.
+
+    Returns ``(results, has_more)``; there is no total count, which would
+    require visiting every match.
+    """
+    expression = match_expression(text)
+    if expression is None:
+        return [], False
+    offset = (page - 1) * page_size
+    if not is_available():
+        return _search_fallback(scope, text, offset, page_size)
+
+    fts_table, sql, fields = SEARCH_SQL[scope]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql.format(order=ORDERINGS[order].format(table=fts_table)),
+            [expression, page_size + 1, offset],
+        )
+        rows = cursor.fetchall()
+    results = [dict(zip(fields, row)) for row in rows[:page_size]]
+    for result in results:
+        # bm25 отрицательный: чем меньше, тем релевантнее
+        result["score"] = round(-result["score"], 4)
+    return results, len(rows) > page_size
+
+
+def _search_fallback(scope, text, offset, page_size):
+    if scope == "messages":
+        rows = filter_messages(Message.objects.all(), text).order_by("-id").values(
+            "id", "chat", "sender", "timestamp", "content"
+        )
+    else:
+        rows = filter_chats(Chat.objects.all(), text).order_by("-id").values(
+            "id", "doctor", "diagnosis", "correct_diagnosis", "start_time"
+        )
+    rows = list(rows[offset : offset + page_size + 1])
+    return rows[:page_size], len(rows) > page_size
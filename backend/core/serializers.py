@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from .archive import transcript
 from .models import Chat, Message
 import json
 
@@ -25,6 +26,8 @@ class ChatSerializer(serializers.ModelSerializer):
             "score",
             "feedback",
             "is_finished",
+            "status",
+            "evaluation_cached",
             "messages",
             "difficulty",
         ]
@@ -37,9 +40,16 @@ class ChatSerializer(serializers.ModelSerializer):
             "score",
             "feedback",
             "is_finished",
+            "status",
+            "evaluation_cached",
         ]
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation["patient_data"] = json.loads(instance.patient_data)
+        if instance.is_archived:
+            document = transcript(instance)
+            representation["messages"] = document["messages"]
+            representation["patient_data"] = json.loads(document["patient_data"])
+        else:
+            representation["patient_data"] = json.loads(instance.patient_data)
         return representation
@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from users.models import DifficultyStats
+
+from .models import DiseaseStats, Message
+from .scoring import is_correct_diagnosis
+
+
+def game_summary(chat_id, correct_diagnosis, diagnosis, score, correct, end_time):
+    return {
+        "chat": chat_id,
+        "correct_diagnosis": correct_diagnosis,
+        "diagnosis": diagnosis,
+        "score": score,
+        "correct": correct,
+        "finished_at": end_time.isoformat() if end_time else None,
+    }
+
+
+def _increment(model, key, increments, initial):
+    """
+    Apply ``increments`` (F() expressions) to the row matching ``key``,
+    creating it from ``initial`` for the first game. Returns the row's queryset.
+    """
+    rows = model.objects.filter(**key)
+    if not rows.update(**increments):
+        model.objects.create(**key, **initial)
+    return rows
+
+
+def record_game(chat):
+    """
+    Add a just-finished chat to its doctor's per-difficulty statistics and
+    to the per-disease statistics.
+
+    Counters are bumped with UPDATEs of F() expressions before anything is
+    read; on SQLite the first one takes the write lock, so the following
+    read-modify-write of recent_games cannot interleave with another game.
+    """
+    score = chat.score or 0
+    correct = int(is_correct_diagnosis(chat.correct_diagnosis, chat.diagnosis))
+    turns = Message.objects.filter(chat_id=chat.pk, sender="doctor").count()
+    summary = game_summary(
+        chat.pk, chat.correct_diagnosis, chat.diagnosis, score, bool(correct), chat.end_time
+    )
+    with transaction.atomic():
+        user_stats = _increment(
+            DifficultyStats,
+            {"user_id": chat.doctor_id, "difficulty": chat.difficulty},
+            {
+                "games": F("games") + 1,
+                "score_sum": F("score_sum") + score,
+                "correct_diagnoses": F("correct_diagnoses") + correct,
+                "best_score": Greatest(F("best_score"), score),
+            },
+            {
+                "games": 1,
+                "score_sum": score,
+                "correct_diagnoses": correct,
+                "best_score": score,
+            },
+        )
+        recent = user_stats.values_list("recent_games", flat=True).get()
+        user_stats.update(
+            recent_games=[summary, *recent][: settings.USER_STATS_RECENT_GAMES]
+        )
+
+        _increment(
+            DiseaseStats,
+            {"disease_name": chat.correct_diagnosis, "difficulty": chat.difficulty},
+            {
+                "games": F("games") + 1,
+                "score_sum": F("score_sum") + score,
+                "correct_diagnoses": F("correct_diagnoses") + correct,
+                "turns_sum": F("turns_sum") + turns,
+            },
+            {"games": 1, "score_sum": score, "correct_diagnoses": correct, "turns_sum": turns},
+        )
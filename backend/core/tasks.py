@@ -0,0 +1,26 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "BACKGROUND_TASK_WORKERS", 2),
+    thread_name_prefix="core-tasks",
+)
+
+
+def _run(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception(f"Background task {func.__name__} failed")
+    finally:
+        connection.close()
+
+
+def run_async(func, *args, **kwargs):
+    """Run ``func`` on the background pool once the current transaction commits."""
+    transaction.on_commit(lambda: _executor.submit(_run, func, args, kwargs))
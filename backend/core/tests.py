@@ -1,3 +1,586 @@
-from django.test import TestCase
+import importlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from users.models import CustomUser
+from .archive import archive_batch
+from .case_library import store_case
+from .export import iter_rows, watermark
+from .models import Chat, IdempotencyKey, Message
+from .renderers import FastJSONRenderer
+from .retention import purge
+from .scoring import DIAGNOSIS_POINTS, edit_distance, score_diagnosis
+from .parsing import (
+    EVALUATION_SCHEMA,
+    StructuredOutputError,
+    complete_structured,
+    extract_json_object,
+    parse_legacy_evaluation,
+    parse_output,
+    parse_points,
+    validate_evaluation,
+    validate_qualitative_evaluation,
+)
+from .views import ChatViewSet
+
+
+class EndGameConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="doctor@example.com", password="password"
+        )
+        self.chat = Chat.objects.create(
+            doctor=self.user,
+            patient_data="{}",
+            patient_responses="{}",
+            correct_diagnosis="Грипп",
+        )
+
+    def test_parallel_end_game_evaluates_once(self):
+        calls = []
+
+        def slow_evaluation(view, chat, answer):
+            calls.append(answer)
+            time.sleep(0.5)
+            return {
+                "correct_diagnosis": chat.correct_diagnosis,
+                "score": 4000,
+                "feedback": "Хорошо",
+            }
+
+        responses = []
+        barrier = threading.Barrier(5)
+
+        def submit():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                responses.append(
+                    client.post(
+                        f"/api/core/chats/{self.chat.pk}/end_game/",
+                        {"answer": "Грипп"},
+                    )
+                )
+            finally:
+                connection.close()
+
+        with mock.patch.object(
+            ChatViewSet, "evaluate_answer", autospec=True, side_effect=slow_evaluation
+        ):
+            threads = [threading.Thread(target=submit) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(responses), 5)
+        for response in responses:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["score"], 4000)
+
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.status, "finished")
+        self.assertTrue(self.chat.is_finished)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.points, 4000)
+
+
+EVALUATION = {"correct_diagnosis": "Грипп", "score": 4000, "feedback": "Хорошо"}
+
+
+class EndGameLeaseTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="doctor@example.com", password="password"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_chat(self, started_ago):
+        return Chat.objects.create(
+            doctor=self.user,
+            patient_data="{}",
+            patient_responses="{}",
+            correct_diagnosis="Грипп",
+            status="evaluating",
+            evaluation_started_at=timezone.now() - started_ago,
+        )
+
+    def end_game(self, chat):
+        return self.client.post(f"/api/core/chats/{chat.pk}/end_game/", {"answer": "Грипп"})
+
+    @mock.patch.object(ChatViewSet, "evaluate_answer", return_value=dict(EVALUATION))
+    def test_stale_claim_is_reclaimed(self, evaluate):
+        chat = self.create_chat(timedelta(seconds=settings.EVALUATION_WAIT_TIMEOUT + 1))
+
+        response = self.end_game(chat)
+
+        self.assertEqual(response.status_code, 200)
+        evaluate.assert_called_once()
+        chat.refresh_from_db()
+        self.assertEqual(chat.status, "finished")
+        self.assertEqual(chat.score, 4000)
+
+    @override_settings(EVALUATION_WAIT_TIMEOUT=0.3, EVALUATION_POLL_INTERVAL=0.05)
+    @mock.patch.object(ChatViewSet, "evaluate_answer", return_value=dict(EVALUATION))
+    def test_live_claim_is_not_reclaimed(self, evaluate):
+        chat = self.create_chat(timedelta(0))
+
+        response = self.end_game(chat)
+
+        self.assertEqual(response.status_code, 409)
+        evaluate.assert_not_called()
+
+    def test_finishing_keeps_counters_written_during_evaluation(self):
+        chat = Chat.objects.create(
+            doctor=self.user,
+            patient_data="{}",
+            patient_responses="{}",
+            correct_diagnosis="Грипп",
+            llm_calls=1,
+            prompt_tokens=100,
+        )
+
+        def evaluate(view, chat, answer):
+            # Так record_usage и фоновая сводка пишут во время оценки
+            Chat.objects.filter(pk=chat.pk).update(
+                llm_calls=F("llm_calls") + 1,
+                prompt_tokens=F("prompt_tokens") + 100,
+                conversation_summary="Жалуется на температуру",
+            )
+            return dict(EVALUATION)
+
+        with mock.patch.object(ChatViewSet, "evaluate_answer", autospec=True, side_effect=evaluate):
+            response = self.end_game(chat)
+
+        self.assertEqual(response.status_code, 200)
+        chat.refresh_from_db()
+        self.assertEqual((chat.llm_calls, chat.prompt_tokens), (2, 200))
+        self.assertEqual(chat.conversation_summary, "Жалуется на температуру")
+        self.assertEqual(chat.status, "finished")
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.points, 4000)
+
+
+class ChatRetrieveTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="doctor@example.com", password="password"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_non_numeric_chat_id_is_not_found(self):
+        self.assertEqual(self.client.get("/api/core/chats/abc/").status_code, 404)
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="doctor@example.com", password="password"
+        )
+        self.chat = Chat.objects.create(
+            doctor=self.user,
+            patient_data="{}",
+            patient_responses="{}",
+            correct_diagnosis="Грипп",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def end_game(self, key="key-1", chat=None):
+        chat = chat or self.chat
+        return self.client.post(
+            f"/api/core/chats/{chat.pk}/end_game/",
+            {"answer": "Грипп"},
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def in_progress_key(self, locked_for):
+        now = timezone.now()
+        return IdempotencyKey.objects.create(
+            user=self.user,
+            key="key-1",
+            endpoint=f"end_game:{self.chat.pk}",
+            expires_at=now + timedelta(hours=1),
+            locked_until=now + locked_for,
+        )
+
+    @mock.patch.object(ChatViewSet, "evaluate_answer", return_value=dict(EVALUATION))
+    def test_retry_replays_stored_response(self, evaluate):
+        first = self.end_game()
+        second = self.end_game()
+
+        evaluate.assert_called_once()
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+
+    @mock.patch.object(ChatViewSet, "evaluate_answer", return_value=dict(EVALUATION))
+    def test_key_reused_for_another_request_is_rejected(self, evaluate):
+        other = Chat.objects.create(
+            doctor=self.user,
+            patient_data="{}",
+            patient_responses="{}",
+            correct_diagnosis="Мигрень",
+        )
+        self.end_game()
+
+        response = self.end_game(chat=other)
+
+        self.assertEqual(response.status_code, 422)
+        evaluate.assert_called_once()
+
+    @mock.patch.object(
+        ChatViewSet, "evaluate_answer", side_effect=StructuredOutputError("bad output")
+    )
+    def test_key_is_released_after_server_error(self, evaluate):
+        response = self.end_game()
+
+        self.assertEqual(response.status_code, 502)
+        self.assertFalse(IdempotencyKey.objects.filter(key="key-1").exists())
+
+    @mock.patch.object(ChatViewSet, "evaluate_answer", return_value=dict(EVALUATION))
+    def test_duplicate_waits_for_in_progress_request(self, evaluate):
+        record = self.in_progress_key(timedelta(minutes=1))
+
+        def first_request_finishes(seconds):
+            IdempotencyKey.objects.filter(pk=record.pk).update(
+                status="completed", response_status=200, response_body='{"score": 3000}'
+            )
+
+        with mock.patch("core.idempotency.time.sleep", side_effect=first_request_finishes):
+            response = self.end_game()
+
+        evaluate.assert_not_called()
+        self.assertEqual(response.json(), {"score": 3000})
+        self.assertEqual(response["Idempotent-Replayed"], "true")
+
+    @mock.patch.object(ChatViewSet, "evaluate_answer", return_value=dict(EVALUATION))
+    def test_expired_lock_is_taken_over(self, evaluate):
+        self.in_progress_key(timedelta(seconds=-1))
+
+        response = self.end_game()
+
+        self.assertEqual(response.status_code, 200)
+        evaluate.assert_called_once()
+        record = IdempotencyKey.objects.get(key="key-1")
+        self.assertEqual(record.status, "completed")
+
+
+def completion(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class StructuredOutputTests(SimpleTestCase):
+    def test_parse_points(self):
+        self.assertEqual(parse_points(4500), 4500)
+        self.assertEqual(parse_points("4500"), 4500)
+        self.assertEqual(parse_points("4 500 баллов"), 4500)
+        self.assertEqual(parse_points("4500/5000"), 4500)
+        self.assertEqual(parse_points(7000), 5000)
+        self.assertEqual(parse_points("-20"), 0)
+        with self.assertRaises(ValueError):
+            parse_points("отлично")
+        with self.assertRaises(ValueError):
+            parse_points(True)
+
+    def test_extract_json_object(self):
+        self.assertEqual(
+            extract_json_object('```json\n{"score": 4500, "feedback": "ok"}\n```'),
+            {"score": 4500, "feedback": "ok"},
+        )
+        self.assertEqual(
+            extract_json_object('Вот оценка: {"score": 1, "feedback": "a } b"} Удачи!'),
+            {"score": 1, "feedback": "a } b"},
+        )
+        with self.assertRaises(ValueError):
+            extract_json_object('{"score": 1, "feedback": "обрыв')
+
+    def test_parse_output_reports_repairs(self):
+        data, repaired = parse_output('{"score": 4500, "feedback": "ok"}', validate_evaluation)
+        self.assertEqual((data["score"], repaired), (4500, False))
+
+        data, repaired = parse_output(
+            'Оценка ниже.\n```json\n{"score": "4 500 баллов", "feedback": " ok "}\n```',
+            validate_evaluation,
+        )
+        self.assertEqual(data, {"score": 4500, "feedback": "ok"})
+        self.assertTrue(repaired)
+
+    def test_parse_output_falls_back_to_legacy_format(self):
+        text = "Оценка: 3200/5000\nОбратная связь: Диагноз верный, но анамнез неполный."
+        data, repaired = parse_output(text, validate_evaluation, parse_legacy_evaluation)
+        self.assertEqual(data["score"], 3200)
+        self.assertEqual(data["feedback"], "Диагноз верный, но анамнез неполный.")
+        self.assertTrue(repaired)
+
+        with self.assertRaises(ValueError):
+            parse_output("Не могу оценить", validate_evaluation, parse_legacy_evaluation)
+
+    def test_legacy_fallback_is_validated(self):
+        data, _ = parse_output(
+            "Оценка: 4800\nОбратная связь: Отлично.",
+            validate_qualitative_evaluation,
+            parse_legacy_evaluation,
+        )
+        self.assertEqual(data, {"score": 3000, "feedback": "Отлично."})
+
+    def test_complete_structured_retries_then_gives_up(self):
+        with mock.patch("core.parsing.complete", return_value=completion("не JSON")) as complete:
+            with self.assertRaises(StructuredOutputError):
+                complete_structured(
+                    "evaluate_answer", [], "evaluation", EVALUATION_SCHEMA, validate_evaluation
+                )
+        self.assertEqual(complete.call_count, 1 + settings.LLM_STRUCTURED_MAX_RETRIES)
+
+    def test_complete_structured_retries_only_unrepairable_output(self):
+        responses = [completion("не JSON"), completion('```{"score": 10, "feedback": "ok"}```')]
+        with mock.patch("core.parsing.complete", side_effect=responses) as complete:
+            data = complete_structured(
+                "evaluate_answer", [], "evaluation", EVALUATION_SCHEMA, validate_evaluation
+            )
+        self.assertEqual(data, {"score": 10, "feedback": "ok"})
+        self.assertEqual(complete.call_count, 2)
+
+
+class DiagnosisScoringTests(TestCase):
+    def assertMatch(self, correct, answer, match, points=None):
+        result = score_diagnosis(correct, answer)
+        self.assertEqual(result["match"], match, answer)
+        if points is not None:
+            self.assertEqual(result["points"], points, answer)
+
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance("грипп", "грипп"), 0)
+        self.assertEqual(edit_distance("грипп", "грип"), 1)
+        self.assertEqual(edit_distance("грипп", "гирпп"), 1)
+        self.assertEqual(edit_distance("грипп", "мигрень"), 5)
+
+    def test_exact_and_synonym_answers(self):
+        self.assertMatch("Грипп", "грипп", "exact", DIAGNOSIS_POINTS)
+        self.assertMatch("Простуда", "ОРВИ", "exact", DIAGNOSIS_POINTS)
+        self.assertMatch("Астма", "бронхиальная астма", "exact", DIAGNOSIS_POINTS)
+
+    def test_typo_in_short_name_is_correct(self):
+        self.assertMatch("Грипп", "Грип", "fuzzy", DIAGNOSIS_POINTS)
+        self.assertMatch("Грипп", "Гирпп", "fuzzy", DIAGNOSIS_POINTS)
+        self.assertMatch("Пневмония", "Пневмания", "fuzzy", DIAGNOSIS_POINTS)
+
+    def test_numbers_are_not_typos(self):
+        result = score_diagnosis("Диабет 2 типа", "Диабет 1 типа")
+        self.assertNotIn(result["match"], ("exact", "fuzzy"))
+
+    def test_other_catalog_disease_is_wrong(self):
+        self.assertMatch("Грипп", "Мигрень", "wrong", 0)
+        self.assertMatch("Грипп", "", "empty", 0)
+
+
+class RendererTests(SimpleTestCase):
+    def test_non_string_keys_are_rendered_like_stdlib(self):
+        data = {"batch_sizes": {1: 10, 3: 2}, "name": "Грипп"}
+        rendered = FastJSONRenderer().render(data)
+        self.assertEqual(json.loads(rendered), {"batch_sizes": {"1": 10, "3": 2}, "name": "Грипп"})
+        self.assertIn("Грипп".encode(), rendered)
+
+    def test_values_orjson_rejects_fall_back_to_stdlib_renderer(self):
+        # orjson не сериализует целые больше 64 бит
+        data = {"total": 2**70}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+@override_settings(EXPORT_SETTLE_DELAY=0)
+class IncrementalExportTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="doctor@example.com", password="password"
+        )
+        self.chat = Chat.objects.create(
+            doctor=self.user,
+            patient_data="{}",
+            patient_responses="{}",
+            correct_diagnosis="Грипп",
+        )
+
+    def finish(self, chat, score=4000):
+        chat.score = score
+        chat.is_finished = True
+        chat.status = "finished"
+        chat.end_time = timezone.now()
+        chat.save()
+
+    def export(self, dataset, since):
+        until = watermark(dataset)
+        return list(iter_rows(dataset, since, until)), until
+
+    def test_chat_is_exported_once_it_finishes(self):
+        rows, position = self.export("chats", 0)
+        self.assertEqual(rows, [])
+
+        self.finish(self.chat)
+        rows, position = self.export("chats", position)
+        self.assertEqual([(row[0], row[9]) for row in rows], [(self.chat.pk, 4000)])
+
+        rows, _ = self.export("chats", position)
+        self.assertEqual(rows, [])
+
+    def test_changed_scores_are_exported_again(self):
+        _, position = self.export("scores", 0)
+
+        self.finish(self.chat, score=2500)
+        rows, position = self.export("scores", position)
+        self.assertEqual([(row[1], row[3]) for row in rows], [(self.user.pk, 2500)])
+
+        rows, _ = self.export("scores", position)
+        self.assertEqual(rows, [])
+
+    def test_legacy_chat_without_end_time_is_exported_after_backfill(self):
+        message = Message.objects.create(chat=self.chat, sender="doctor", content="Что беспокоит?")
+        # Так завершал игру end_game до появления end_time
+        Chat.objects.filter(pk=self.chat.pk).update(is_finished=True, status="finished", score=3000)
+
+        backfill = importlib.import_module("core.migrations.0025_backfill_chat_end_time")
+        backfill.backfill_end_time(apps, None)
+
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.end_time, message.timestamp)
+        rows, _ = self.export("chats", 0)
+        self.assertEqual([row[0] for row in rows], [self.chat.pk])
+
+    def test_archived_messages_are_exported(self):
+        for content in ("Что беспокоит?", "Температура"):
+            Message.objects.create(chat=self.chat, sender="doctor", content=content)
+        self.finish(self.chat)
+        archive_batch(timezone.now() + timedelta(seconds=1), batch_size=10)
+        self.assertFalse(Message.objects.exists())
+
+        rows, _ = self.export("messages", 0)
+        self.assertEqual(
+            [(row[1], row[3]) for row in rows],
+            [(self.chat.pk, "Что беспокоит?"), (self.chat.pk, "Температура")],
+        )
+
+
+class LegacyFinishedChatTests(TestCase):
+    """Chats finished before end_time was recorded, after the 0025 backfill."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="doctor@example.com", password="password"
+        )
+        self.chat = Chat.objects.create(
+            doctor=self.user,
+            patient_data="{}",
+            patient_responses="{}",
+            correct_diagnosis="Грипп",
+        )
+        long_ago = timezone.now() - timedelta(days=400)
+        message = Message.objects.create(chat=self.chat, sender="doctor", content="Что беспокоит?")
+        Message.objects.filter(pk=message.pk).update(timestamp=long_ago)
+        Chat.objects.filter(pk=self.chat.pk).update(
+            is_finished=True, status="finished", score=3000, start_time=long_ago
+        )
+        backfill = importlib.import_module("core.migrations.0025_backfill_chat_end_time")
+        backfill.backfill_end_time(apps, None)
+
+    def test_legacy_chat_is_archived(self):
+        archived, messages, _, _ = archive_batch(timezone.now() - timedelta(days=30), 10)
+
+        self.assertEqual((archived, messages), (1, 1))
+        self.chat.refresh_from_db()
+        self.assertTrue(self.chat.is_archived)
+
+    @override_settings(RETENTION_FINISHED_CHAT_DAYS=365)
+    def test_legacy_chat_is_purged(self):
+        chats, rows, _ = purge("finished", batch_size=10, pause=0)
+
+        self.assertEqual((chats, rows), (1, 2))
+        self.assertFalse(Chat.objects.filter(pk=self.chat.pk).exists())
+
+
+class IdempotencyLockRenewalTests(TransactionTestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="doctor@example.com", password="password"
+        )
+        self.chat = Chat.objects.create(
+            doctor=self.user,
+            patient_data="{}",
+            patient_responses="{}",
+            correct_diagnosis="Грипп",
+        )
+
+    @override_settings(IDEMPOTENCY_LOCK_TIMEOUT=0.3)
+    def test_lock_is_renewed_while_action_runs(self):
+        leases = []
+
+        def slow_evaluation(view, chat, answer):
+            # Дольше исходной аренды ключа
+            time.sleep(1)
+            record = IdempotencyKey.objects.get(key="key-1")
+            leases.append(record.locked_until > timezone.now())
+            return dict(EVALUATION)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch.object(
+            ChatViewSet, "evaluate_answer", autospec=True, side_effect=slow_evaluation
+        ):
+            response = client.post(
+                f"/api/core/chats/{self.chat.pk}/end_game/",
+                {"answer": "Грипп"},
+                HTTP_IDEMPOTENCY_KEY="key-1",
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(leases, [True])
+
+
+class CaseLibraryTests(TestCase):
+    def test_same_content_for_another_disease_is_a_separate_case(self):
+        generated = {
+            "patient_data": {"Имя": "Анна", "Возраст": 34},
+            "patient_responses": {"Что беспокоит?": "Голова болит"},
+        }
+
+        flu = store_case("Грипп", "easy", generated)
+        migraine = store_case("Мигрень", "easy", generated)
+
+        self.assertNotEqual(flu.pk, migraine.pk)
+        self.assertEqual((flu.disease, migraine.disease), ("Грипп", "Мигрень"))
+        self.assertEqual(store_case("Грипп", "easy", generated).pk, flu.pk)
+
+
+class StartupTests(SimpleTestCase):
+    def test_boot_does_not_import_llm_stack(self):
+        script = (
+            "import sys, django; django.setup(); import backend.urls; "
+            "print(','.join(m for m in ('openai', 'httpx', 'pydantic') if m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, "DJANGO_SETTINGS_MODULE": "backend.settings"},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.strip(), "")
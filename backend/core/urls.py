@@ -1,10 +1,30 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ChatViewSet
+from .views import (
+    ChatViewSet,
+    DiseaseAnalyticsView,
+    DiseaseAutocompleteView,
+    LLMStatsView,
+    StaffExportView,
+    StaffSearchView,
+)
 
 router = DefaultRouter()
 router.register(r"chats", ChatViewSet)
 
 urlpatterns = [
     path("", include(router.urls)),
+    path(
+        "diseases/autocomplete/",
+        DiseaseAutocompleteView.as_view(),
+        name="disease-autocomplete",
+    ),
+    path("llm-stats/", LLMStatsView.as_view(), name="llm-stats"),
+    path("search/", StaffSearchView.as_view(), name="staff-search"),
+    path("export/", StaffExportView.as_view(), name="staff-export"),
+    path(
+        "analytics/diseases/",
+        DiseaseAnalyticsView.as_view(),
+        name="disease-analytics",
+    ),
 ]
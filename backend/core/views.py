@@ -1,34 +1,63 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from .models import Chat, Message
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.views import APIView
+from .models import Chat, DiseaseStats, Message
 from .serializers import ChatSerializer, MessageSerializer
-from openai import OpenAI
-import os
-from dotenv import load_dotenv, find_dotenv
+from .idempotency import idempotent
+from .conditional import make_etag, not_modified, with_etag
+from .autocomplete import get_index
+from .search import ORDERINGS, SEARCH_SQL, search
+from .export import DATASETS, FORMATS, export_stream, filename, watermark
+from .llm import LLMError, complete, latency_tracker, record_usage
+from .batching import patient_reply_batcher
+from .parsing import (
+    EVALUATION_SCHEMA,
+    QUALITATIVE_EVALUATION_SCHEMA,
+    StructuredOutputError,
+    complete_structured,
+    parse_legacy_evaluation,
+    parse_stats,
+    validate_evaluation,
+    validate_qualitative_evaluation,
+)
+from .scoring import score_diagnosis, score_questions_offline
+from .stats import record_game
+from .sampling import adaptive_factor
+from .eval_cache import cache_evaluation, evaluation_fingerprint, get_cached_evaluation
+from .case_library import (
+    choose_disease,
+    generate_case,
+    store_case,
+    take_case,
+)
+from .prompts import build_patient_messages, compact_json
+from .memory import build_conversation_messages, schedule_summary_update
 import logging
 import json
-from .disease_lists import COMMON_DISEASES, MEDIUM_DISEASES, HARD_DISEASES
-import random
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F, Q
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
-load_dotenv(find_dotenv())
-
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-
 
 class ChatViewSet(viewsets.ModelViewSet):
     serializer_class = ChatSerializer
     permission_classes = [IsAuthenticated]
     queryset = Chat.objects.all()
+    # Чтение чатов (частый поллинг) можно обслуживать по данным токена
+    claims_only_actions = ("list", "retrieve")
 
     def get_queryset(self):
-        return Chat.objects.filter(doctor=self.request.user)
+        return Chat.objects.filter(doctor_id=self.request.user.pk).select_related("archive")
 
     def check_object_permissions(self, request, obj):
-        if obj.doctor != request.user:
+        if obj.doctor_id != request.user.pk:
             raise PermissionDenied("You do not have permission to access this chat.")
         return super().check_object_permissions(request, obj)
 
@@ -38,7 +67,28 @@ class ChatViewSet(viewsets.ModelViewSet):
 
     def retrieve(self, request, *args, **kwargs):
         logger.info(f"User {request.user.id} requested chat {kwargs.get('pk')}")
-        return super().retrieve(request, *args, **kwargs)
+        # Проверяем версию чата одним запросом, не загружая сообщения
+        try:
+            version = (
+                self.get_queryset()
+                .filter(pk=kwargs.get("pk"))
+                .values_list("version", flat=True)
+                .first()
+            )
+        except (TypeError, ValueError):
+            # Как get_object_or_404 в DRF: нечисловой pk - это 404, а не 500
+            raise Http404
+        if version is not None:
+            etag = make_etag("chat", kwargs.get("pk"), version)
+            response = not_modified(request, etag)
+            if response is not None:
+                return response
+
+        chat = self.get_object()
+        return with_etag(
+            Response(self.get_serializer(chat).data),
+            make_etag("chat", chat.pk, chat.version),
+        )
 
     def create(self, request, *args, **kwargs):
         logger.info(f"User {request.user.id} is creating a new chat")
@@ -49,71 +99,123 @@ class ChatViewSet(viewsets.ModelViewSet):
         serializer.save(doctor=self.request.user, patient_data=json.dumps(patient_data))
 
     def generate_patient(self, difficulty):
-        if difficulty == "easy":
-            disease = random.choice(COMMON_DISEASES)
-            description_quality = "подробно и точно"
-        elif difficulty == "medium":
-            disease = random.choice(COMMON_DISEASES + MEDIUM_DISEASES)
-            description_quality = "достаточно точно, но может упустить некоторые детали"
-        else:  # hard
-            disease = random.choice(COMMON_DISEASES + MEDIUM_DISEASES + HARD_DISEASES)
-            description_quality = "неточно, может путаться в описаниях и жаловаться на не связанные с болезнью симптомы"
-
-        prompt = f"""Создайте данные виртуального пациента с заболеванием: {disease}.
-        Пациент должен описывать свои симптомы {description_quality}.
-        Включите следующую информацию:
-        1. Имя
-        2. Возраст
-        3. Пол
-        4. Основные жалобы
-        5. История болезни
-        6. Дополнительная информация
-
-        Также создайте предварительные ответы пациента на следующие вопросы:
-        1. Опишите свои симптомы
-        2. Как долго у вас эти симптомы?
-        3. Есть ли у вас какие-либо аллергии или хронические заболевания?
-        4. Принимаете ли вы какие-либо лекарства?
-        5. Опишите свой внешний вид
-        6. Что вы чувствуете при касании или давлении в области дискомфорта?
-
-        Верните данные в формате JSON с тремя ключами: 'patient_data', 'patient_responses' и 'correct_diagnosis'."""
-
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": prompt},
-            ],
-        )
-
-        generated_data = json.loads(response.choices[0].message.content)
-        generated_data["correct_diagnosis"] = (
-            disease  # Устанавливаем правильный диагноз
-        )
-        return generated_data
+        return generate_case(choose_disease(difficulty), difficulty)
 
+    @idempotent("create")
     def create(self, request, *args, **kwargs):
         difficulty = request.data.get("difficulty", "easy")
-        generated_data = self.generate_patient(difficulty)
+        disease = choose_disease(difficulty, request.user)
+
+        case = None
+        if settings.PATIENT_CASE_LIBRARY_ENABLED:
+            case = take_case(disease, difficulty, request.user)
+
+        if case is not None:
+            from_library = True
+            patient_data = case.patient_data
+            patient_responses = case.patient_responses
+        else:
+            from_library = False
+            try:
+                generated_data = generate_case(disease, difficulty)
+            except StructuredOutputError:
+                return Response(
+                    {"error": "Could not generate a patient, please try again"},
+                    status=status.HTTP_502_BAD_GATEWAY,
+                )
+            if settings.PATIENT_CASE_LIBRARY_ENABLED:
+                case = store_case(disease, difficulty, generated_data)
+            patient_data = json.dumps(generated_data["patient_data"])
+            patient_responses = json.dumps(generated_data["patient_responses"])
 
         chat = Chat.objects.create(
             doctor=request.user,
-            patient_data=json.dumps(generated_data["patient_data"]),
-            patient_responses=json.dumps(generated_data["patient_responses"]),
+            patient_data=patient_data,
+            patient_responses=patient_responses,
             difficulty=difficulty,
-            correct_diagnosis=generated_data[
-                "correct_diagnosis"
-            ],  # Сохраняем правильный диагноз
+            correct_diagnosis=disease,  # Сохраняем правильный диагноз
+            case=case,
+            from_library=from_library,
         )
 
         serializer = self.get_serializer(chat)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def evaluate_answer(self, chat, doctor_answer):
-        doctor_questions = Message.objects.filter(
-            chat=chat, sender="doctor"
-        ).values_list("content", flat=True)
+        doctor_questions = list(
+            Message.objects.filter(chat=chat, sender="doctor").values_list(
+                "content", flat=True
+            )
+        )
+        key = evaluation_fingerprint(
+            chat.correct_diagnosis, doctor_questions, doctor_answer
+        )
+        cached = get_cached_evaluation(key)
+        if cached is not None:
+            logger.info(f"Evaluation cache hit for chat {chat.pk}")
+            return {**cached, "cached": True}
+
+        evaluation, cacheable = self.score_answer(chat, doctor_answer, doctor_questions)
+        if cacheable:
+            cache_evaluation(key, evaluation)
+        return {**evaluation, "cached": False}
+
+    def score_answer(self, chat, doctor_answer, doctor_questions):
+        """Return the evaluation and whether it may be cached (not a degraded fallback)."""
+        if settings.EVALUATION_MODE == "llm":
+            return (
+                self.evaluate_answer_with_llm(chat, doctor_answer, doctor_questions),
+                True,
+            )
+
+        # Точность диагноза считаем локально, у LLM спрашиваем только качественные критерии
+        accuracy = score_diagnosis(chat.correct_diagnosis, doctor_answer)
+        qualitative = None
+        degraded = False
+        if settings.EVALUATION_MODE != "offline" and doctor_questions:
+            try:
+                qualitative = self.evaluate_questions_with_llm(
+                    chat, doctor_answer, doctor_questions
+                )
+            except (StructuredOutputError, LLMError) as exc:
+                logger.warning(f"LLM evaluation failed for chat {chat.pk}, scoring offline: {exc}")
+                degraded = True
+        if qualitative is None:
+            qualitative = score_questions_offline(doctor_questions)
+
+        evaluation = {
+            "correct_diagnosis": chat.correct_diagnosis,
+            "score": accuracy["points"] + qualitative["score"],
+            "feedback": f"Точность диагноза: {accuracy['points']}/2000. {accuracy['comment']}\n"
+            + qualitative["feedback"],
+        }
+        return evaluation, not degraded
+
+    def evaluate_questions_with_llm(self, chat, doctor_answer, doctor_questions):
+        prompt = f"""Вы - медицинский эксперт. Оцените, как врач собирал анамнез:
+        1. Качество сбора информации о симптомах (0-1000 баллов)
+        2. Вопросы о внешнем виде пациента (0-500 баллов)
+        3. Вопросы о тактильных ощущениях (0-500 баллов)
+        4. Общий подход и логика (0-1000 баллов)
+
+        Правильный диагноз: {chat.correct_diagnosis}
+        Вопросы врача: {compact_json(doctor_questions)}
+        Диагноз врача: {doctor_answer}
+
+        Верните JSON: {{"score": [сумма баллов, 0-3000], "feedback": "[краткий комментарий по каждому критерию]"}}"""
+
+        return complete_structured(
+            "evaluate_answer",
+            [{"role": "system", "content": prompt}],
+            "qualitative_evaluation",
+            QUALITATIVE_EVALUATION_SCHEMA,
+            validate_qualitative_evaluation,
+            fallback=parse_legacy_evaluation,
+            difficulty=chat.difficulty,
+            chat_id=chat.pk,
+        )
 
+    def evaluate_answer_with_llm(self, chat, doctor_answer, doctor_questions):
         prompt = f"""Вы - медицинский эксперт. Оцените работу врача по следующим критериям:
         
 
@@ -128,76 +230,56 @@ class ChatViewSet(viewsets.ModelViewSet):
         Правильный диагноз: {chat.correct_diagnosis}
         
         Вопросы врача:
-        {json.dumps(list(doctor_questions), indent=2)}
+        {compact_json(doctor_questions)}
         
         Окончательный диагноз врача: {doctor_answer}
 
-        Дайте оценку в формате:
-        Оценка: [сумма баллов по всем критериям, 0-5000 баллов]
-        Обратная связь: [краткий комментарий по каждому критерию]"""
-
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": prompt},
-            ],
-        )
-
-        evaluation = response.choices[0].message.content
-        score_line = next(
-            line for line in evaluation.split("\n") if line.startswith("Оценка:")
+        Верните оценку в формате JSON:
+        {{"score": [сумма баллов по всем критериям, целое число 0-5000], "feedback": "[краткий комментарий по каждому критерию]"}}"""
+
+        evaluation = complete_structured(
+            "evaluate_answer",
+            [{"role": "system", "content": prompt}],
+            "evaluation",
+            EVALUATION_SCHEMA,
+            validate_evaluation,
+            fallback=parse_legacy_evaluation,
+            difficulty=chat.difficulty,
+            chat_id=chat.pk,
         )
-        feedback = evaluation.split("Обратная связь:")[1].strip()
-
-        score = int(score_line.split(":")[1].strip())
 
         return {
             "correct_diagnosis": chat.correct_diagnosis,
-            "score": score,
-            "feedback": feedback,
+            "score": evaluation["score"],
+            "feedback": evaluation["feedback"],
         }
 
     def get_patient_response(self, chat, doctor_message):
-        patient_data = json.loads(chat.patient_data)
-        patient_responses = json.loads(chat.patient_responses)
-        difficulty = chat.difficulty
-
-        if difficulty == "easy":
-            response_style = "Отвечайте точно и подробно на вопросы врача."
-        elif difficulty == "medium":
-            response_style = "Отвечайте достаточно точно, но можете иногда упускать некоторые детали или немного путаться."
-        else:  # hard
-            response_style = "Отвечайте неточно, путайтесь в описаниях и иногда жалуйтесь на симптомы, не связанные с вашим основным заболеванием."
-
-        prompt = f"""Вы - виртуальный пациент со следующими данными:
-        {json.dumps(patient_data, indent=2)}
-
-        У вас есть следующие предварительно подготовленные ответы:
-        {json.dumps(patient_responses, indent=2)}
-
-        {response_style}
-
-        Вопрос врача: {doctor_message}
-
-        Если вопрос врача соответствует одному из предварительно подготовленных ответов, используйте его как основу, но адаптируйте под конкретный вопрос. Если вопрос новый, ответьте на него, исходя из данных пациента и стиля ответа.
-
-        Ответьте на вопрос врача от лица пациента."""
-
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": prompt},
-            ],
+        messages = build_patient_messages(
+            chat, build_conversation_messages(chat), doctor_message
         )
+        if settings.LLM_BATCHING_ENABLED:
+            response = patient_reply_batcher.submit(
+                messages, difficulty=chat.difficulty
+            ).result()
+            record_usage(chat.pk, response, "patient_response")
+        else:
+            response = complete(
+                "patient_response",
+                messages,
+                difficulty=chat.difficulty,
+                chat_id=chat.pk,
+            )
 
         return response.choices[0].message.content
 
     @action(detail=True, methods=["post"])
+    @idempotent("send_message")
     def send_message(self, request, pk=None):
         chat = self.get_object()
         content = request.data.get("content")
 
-        if chat.doctor != request.user:
+        if chat.doctor_id != request.user.pk:
             return Response(
                 {"error": "You are not authorized to send messages in this chat"},
                 status=status.HTTP_403_FORBIDDEN,
@@ -209,32 +291,233 @@ class ChatViewSet(viewsets.ModelViewSet):
         patient_message = Message.objects.create(
             chat=chat, sender="patient", content=patient_response
         )
+        Chat.objects.filter(pk=chat.pk).update(version=F("version") + 1)
+        schedule_summary_update(chat)
 
         return Response(MessageSerializer(patient_message).data)
 
     @action(detail=True, methods=["post"])
+    @idempotent("end_game")
     def end_game(self, request, pk=None):
         chat = self.get_object()
         answer = request.data.get("answer")
 
-        if chat.doctor != request.user:
+        if chat.doctor_id != request.user.pk:
             return Response(
                 {"error": "You are not authorized to end this game"},
                 status=status.HTTP_403_FORBIDDEN,
             )
 
-        if chat.is_finished:
+        # Захватываем переход active -> evaluating до вызова LLM,
+        # чтобы параллельные запросы не оценивали игру повторно. Захват
+        # старше EVALUATION_WAIT_TIMEOUT считаем брошенным (воркер упал)
+        now = timezone.now()
+        lease_expired = Q(evaluation_started_at__isnull=True) | Q(
+            evaluation_started_at__lt=now - timedelta(seconds=settings.EVALUATION_WAIT_TIMEOUT)
+        )
+        claimed = (
+            Chat.objects.filter(pk=chat.pk)
+            .filter(Q(status="active") | Q(lease_expired, status="evaluating"))
+            .update(status="evaluating", evaluation_started_at=now, version=F("version") + 1)
+        )
+        if not claimed:
+            return self.evaluation_result(chat)
+
+        try:
+            evaluation = self.evaluate_answer(chat, answer)
+        except Exception as exc:
+            Chat.objects.filter(pk=chat.pk, status="evaluating").update(
+                status="active", evaluation_started_at=None, version=F("version") + 1
+            )
+            if isinstance(exc, StructuredOutputError):
+                return Response(
+                    {"error": "Could not evaluate the answer, please try again"},
+                    status=status.HTTP_502_BAD_GATEWAY,
+                )
+            raise
+
+        # Пишем только поля итога: счетчики LLM и сводку разговора за это время
+        # обновили F()-выражения и фоновая задача. Условие на захват не дает
+        # записать итог, если захват уже перехватил другой запрос
+        result = {
+            "diagnosis": answer,
+            "score": evaluation["score"],
+            "feedback": evaluation["feedback"],
+            "evaluation_cached": evaluation.get("cached", False),
+            "is_finished": True,
+            "status": "finished",
+            "end_time": timezone.now(),
+        }
+        finished = Chat.objects.filter(
+            pk=chat.pk, status="evaluating", evaluation_started_at=now
+        ).update(version=F("version") + 1, **result)
+        if not finished:
+            return self.evaluation_result(chat)
+        for field, value in result.items():
+            setattr(chat, field, value)
+        # update() не отправляет post_save, очки профиля пересчитываем сами
+        chat.doctor.profile.update_points()
+        try:
+            record_game(chat)
+        except Exception:
+            # Статистика не должна ломать завершение игры; ее можно пересчитать
+            logger.exception(f"Could not update statistics for chat {chat.pk}")
+
+        return Response(evaluation)
+
+    def evaluation_result(self, chat):
+        """Respond with the evaluation of a game claimed by another request."""
+        chat = self.wait_for_evaluation(chat)
+        if chat.status != "finished":
+            return Response(
+                {"error": "This game is still being evaluated"},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response(
+            {
+                "correct_diagnosis": chat.correct_diagnosis,
+                "score": chat.score,
+                "feedback": chat.feedback,
+                "cached": chat.evaluation_cached,
+            }
+        )
+
+    def wait_for_evaluation(self, chat):
+        deadline = time.monotonic() + settings.EVALUATION_WAIT_TIMEOUT
+        chat.refresh_from_db()
+        while chat.status == "evaluating" and time.monotonic() < deadline:
+            time.sleep(settings.EVALUATION_POLL_INTERVAL)
+            chat.refresh_from_db()
+        return chat
+
+
+class LLMStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(
+            {
+                "latency_p95": latency_tracker.snapshot(),
+                "patient_reply_batches": patient_reply_batcher.stats(),
+                "structured_output": parse_stats.snapshot(),
+            }
+        )
+
+
+class DiseaseAutocompleteView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get("limit", 10))
+        except ValueError:
+            limit = 10
+        limit = max(1, min(limit, settings.AUTOCOMPLETE_MAX_RESULTS))
+        query = request.query_params.get("q", "")
+        return Response(get_index().search(query, limit))
+
+
+class StaffSearchView(APIView):
+    """Full-text search over messages or chat diagnoses for support staff."""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        scope = request.query_params.get("scope", "messages")
+        order = request.query_params.get("order", "rank")
+        if scope not in SEARCH_SQL or order not in ORDERINGS:
             return Response(
-                {"error": "This game has already ended"},
+                {"error": f"scope must be one of {list(SEARCH_SQL)}, order one of {list(ORDERINGS)}"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        try:
+            page = max(1, int(request.query_params.get("page", 1)))
+            page_size = int(request.query_params.get("page_size", settings.SEARCH_PAGE_SIZE))
+        except ValueError:
+            return Response(
+                {"error": "page and page_size must be integers"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        page_size = max(1, min(page_size, settings.SEARCH_MAX_PAGE_SIZE))
+
+        results, has_more = search(
+            scope, request.query_params.get("q", ""), page, page_size, order
+        )
+        return Response(
+            {
+                "results": results,
+                "page": page,
+                "next_page": page + 1 if has_more else None,
+            }
+        )
 
-        evaluation = self.evaluate_answer(chat, answer)
 
-        chat.diagnosis = answer
-        chat.score = evaluation["score"]
-        chat.feedback = evaluation["feedback"]
-        chat.is_finished = True
-        chat.save()
+class StaffExportView(APIView):
+    """
+    Stream a dataset as JSONL or CSV. The X-Export-Watermark header carries
+    the position reached; pass it as ``since`` to fetch only rows added or
+    changed since then next time.
+    """
 
-        return Response(evaluation)
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        dataset = request.query_params.get("dataset", "chats")
+        # "format" занят переопределением рендерера DRF
+        fmt = request.query_params.get("file_format", "jsonl")
+        if dataset not in DATASETS or fmt not in FORMATS:
+            return Response(
+                {"error": f"dataset must be one of {list(DATASETS)}, file_format one of {list(FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            since = int(request.query_params.get("since", 0))
+        except ValueError:
+            return Response(
+                {"error": "since must be an integer"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        gzip = request.query_params.get("gzip") in ("1", "true")
+        until = watermark(dataset)
+
+        response = StreamingHttpResponse(
+            export_stream(dataset, fmt, since, until, gzip),
+            content_type="application/gzip" if gzip else (
+                "application/x-ndjson" if fmt == "jsonl" else "text/csv"
+            ),
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="{filename(dataset, fmt, since, until, gzip)}"'
+        )
+        response["X-Export-Watermark"] = str(until)
+        return response
+
+
+class DiseaseAnalyticsView(APIView):
+    """Per-disease, per-difficulty outcomes, hardest (lowest success rate) first."""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        rows = DiseaseStats.objects.all()
+        difficulty = request.query_params.get("difficulty")
+        if difficulty:
+            rows = rows.filter(difficulty=difficulty)
+
+        results = []
+        for row in rows:
+            counted = row.games >= settings.DISEASE_ADAPTIVE_MIN_GAMES
+            results.append(
+                {
+                    "disease": row.disease_name,
+                    "difficulty": row.difficulty,
+                    "games": row.games,
+                    "mean_score": round(row.score_sum / row.games) if row.games else None,
+                    "success_rate": round(row.success_rate, 3) if row.games else None,
+                    "mean_turns": round(row.turns_sum / row.games, 1) if row.games else None,
+                    "selection_factor": round(
+                        adaptive_factor(row if counted else None, row.difficulty), 3
+                    ),
+                }
+            )
+        results.sort(key=lambda item: (item["success_rate"] is None, item["success_rate"] or 0))
+        return Response(results)
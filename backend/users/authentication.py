@@ -0,0 +1,153 @@
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+# Claim with the user's primary key, added to tokens at login
+USER_PK_CLAIM = "user_pk"
+
+
+def _principal_key(user_id):
+    return f"auth-principal:{user_id}"
+
+
+class PrincipalCache:
+    """
+    Two-level cache of resolved users keyed by the JWT user id claim.
+
+    The in-process level answers without any I/O for a few seconds; the shared
+    level (the default django cache, which settings require to be
+    cross-process) lets all workers reuse one database lookup. Saving or
+    deleting a user drops both levels in the current process and the shared
+    entry, so other workers notice within the in-process TTL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # user id claim -> (expires_at, user)
+
+    def get(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            # Копия, чтобы запросы не делили кэш связанных объектов
+            return copy.copy(entry[1])
+        user = cache.get(_principal_key(user_id))
+        if user is not None:
+            self._remember(user_id, user)
+            return copy.copy(user)
+        return None
+
+    def set(self, user_id, user):
+        user = copy.copy(user)
+        cache.set(_principal_key(user_id), user, settings.AUTH_PRINCIPAL_CACHE_TTL)
+        self._remember(user_id, user)
+
+    def forget(self, user_id):
+        cache.delete(_principal_key(user_id))
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, user_id, user):
+        expires_at = time.monotonic() + settings.AUTH_PRINCIPAL_LOCAL_TTL
+        with self._lock:
+            if len(self._entries) >= settings.AUTH_PRINCIPAL_LOCAL_MAX_ENTRIES:
+                self._entries.clear()
+            self._entries[user_id] = (expires_at, user)
+
+
+principals = PrincipalCache()
+
+
+def forget_principal(user):
+    principals.forget(getattr(user, api_settings.USER_ID_FIELD))
+
+
+class TokenPrincipal(TokenUser):
+    """Stateless user backed by the token claims, with the real primary key."""
+
+    @property
+    def id(self):
+        return self.token[USER_PK_CLAIM]
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def email(self):
+        return self.token[api_settings.USER_ID_CLAIM]
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves users through ``principals`` instead of
+    querying the database on every request.
+
+    Views may list read actions in ``claims_only_actions``; when
+    AUTH_CLAIMS_ONLY_READS is on, safe requests to those actions get a
+    TokenPrincipal built from the token alone. Such views must only use
+    ``request.user.pk`` and token claims.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        if self.allows_claims_only(request, validated_token):
+            return TokenPrincipal(validated_token), validated_token
+        return self.get_user(validated_token), validated_token
+
+    def allows_claims_only(self, request, validated_token):
+        if not settings.AUTH_CLAIMS_ONLY_READS or request.method not in SAFE_METHODS:
+            return False
+        # Токены, выданные до появления user_pk, проверяем по базе
+        if USER_PK_CLAIM not in validated_token:
+            return False
+        view = (getattr(request, "parser_context", None) or {}).get("view")
+        return getattr(view, "action", None) in getattr(view, "claims_only_actions", ())
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = principals.get(user_id)
+        if user is None:
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            principals.set(user_id, user)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
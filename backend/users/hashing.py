@@ -0,0 +1,52 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.PASSWORD_HASHING_WORKERS,
+                    thread_name_prefix="password-hashing",
+                )
+    return _executor
+
+
+def _run(func, *args):
+    """
+    Run a hashing call according to PASSWORD_HASHING_STRATEGY.
+
+    With "pool", at most PASSWORD_HASHING_WORKERS hashes run at once however
+    many request threads are logging in; PBKDF2 releases the GIL, so the
+    waiting request threads keep serving other traffic.
+    """
+    if settings.PASSWORD_HASHING_STRATEGY == "pool":
+        return _get_executor().submit(func, *args).result()
+    return func(*args)
+
+
+def make_password(password):
+    return _run(hashers.make_password, password)
+
+
+def check_password(password, encoded, setter=None):
+    """
+    Verify ``password`` like django.contrib.auth.hashers.check_password.
+
+    When the stored hash uses an outdated hasher or iteration count, ``setter``
+    is called on the caller's thread after a successful check, so the upgraded
+    hash is saved in the request's own transaction.
+    """
+    needs_upgrade = []
+    is_correct = _run(hashers.check_password, password, encoded, needs_upgrade.append)
+    if is_correct and needs_upgrade and setter is not None:
+        setter(password)
+    return is_correct
@@ -0,0 +1,72 @@
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Chat
+from core.scoring import is_correct_diagnosis
+from core.stats import game_summary
+from users.models import DifficultyStats
+
+FIELDS = ("id", "doctor_id", "difficulty", "correct_diagnosis", "diagnosis", "score", "end_time")
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild per-user difficulty statistics from all finished chats. "
+        "Reads chats in keyset windows, then replaces the table in one transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--window", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        recent_size = settings.USER_STATS_RECENT_GAMES
+        totals = defaultdict(
+            lambda: {"games": 0, "score_sum": 0, "correct": 0, "best": 0, "recent": deque(maxlen=recent_size)}
+        )
+        last_id = chats = 0
+        while True:
+            rows = list(
+                Chat.objects.filter(is_finished=True, pk__gt=last_id)
+                .order_by("pk")
+                .values_list(*FIELDS)[: options["window"]]
+            )
+            if not rows:
+                break
+            for chat_id, doctor_id, difficulty, correct_diagnosis, diagnosis, score, end_time in rows:
+                score = score or 0
+                correct = is_correct_diagnosis(correct_diagnosis, diagnosis)
+                entry = totals[doctor_id, difficulty]
+                entry["games"] += 1
+                entry["score_sum"] += score
+                entry["correct"] += correct
+                entry["best"] = max(entry["best"], score)
+                entry["recent"].append(
+                    game_summary(chat_id, correct_diagnosis, diagnosis, score, correct, end_time)
+                )
+            last_id = rows[-1][0]
+            chats += len(rows)
+
+        with transaction.atomic():
+            DifficultyStats.objects.all().delete()
+            DifficultyStats.objects.bulk_create(
+                [
+                    DifficultyStats(
+                        user_id=doctor_id,
+                        difficulty=difficulty,
+                        games=entry["games"],
+                        score_sum=entry["score_sum"],
+                        correct_diagnoses=entry["correct"],
+                        best_score=entry["best"],
+                        # Новые игры первыми, как в record_game
+                        recent_games=list(reversed(entry["recent"])),
+                    )
+                    for (doctor_id, difficulty), entry in totals.items()
+                ],
+                batch_size=1000,
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt {len(totals)} statistics rows from {chats} finished chats")
+        )
@@ -0,0 +1,82 @@
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from users.models import CustomUser, Profile
+
+EMAIL_PREFIX = "bench-auth-"
+PASSWORD = "bench-Password-42"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark registration and login (/api/token/) throughput with the inline "
+        "and pooled password hashing strategies. Creates and then deletes bench users."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20, help="Users registered per strategy")
+        parser.add_argument("--logins", type=int, default=100, help="Logins per strategy")
+        parser.add_argument("--concurrency", type=int, default=8, help="Parallel client threads")
+
+    def _request(self, path, data):
+        try:
+            started = time.perf_counter()
+            response = Client().post(path, data, content_type="application/json")
+            elapsed = time.perf_counter() - started
+            return response.status_code, elapsed
+        finally:
+            connection.close()
+
+    def _run(self, label, path, payloads, concurrency):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda data: self._request(path, data), payloads))
+        total = time.perf_counter() - started
+
+        latencies = sorted(elapsed for _, elapsed in results)
+        failures = sum(1 for status, _ in results if status >= 400)
+        p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+        self.stdout.write(
+            f"  {label:<13} {len(results) / total:8.1f} req/s  "
+            f"median {statistics.median(latencies) * 1000:7.1f} ms  "
+            f"p95 {p95 * 1000:7.1f} ms  failures {failures}"
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options["concurrency"]
+        try:
+            for strategy in ("inline", "pool"):
+                self.stdout.write(f"\nPASSWORD_HASHING_STRATEGY={strategy!r}")
+                with override_settings(PASSWORD_HASHING_STRATEGY=strategy):
+                    run_id = uuid.uuid4().hex[:8]
+                    emails = [
+                        f"{EMAIL_PREFIX}{run_id}-{index}@example.com"
+                        for index in range(options["users"])
+                    ]
+                    self._run(
+                        "registration",
+                        "/api/users/users/register/",
+                        [
+                            {"email": email, "username": "bench", "password": PASSWORD}
+                            for email in emails
+                        ],
+                        concurrency,
+                    )
+                    self._run(
+                        "login",
+                        "/api/token/",
+                        [
+                            {"email": emails[index % len(emails)], "password": PASSWORD}
+                            for index in range(options["logins"])
+                        ],
+                        concurrency,
+                    )
+        finally:
+            CustomUser.objects.filter(email__startswith=EMAIL_PREFIX).delete()
+            Profile.update_ranks()
@@ -0,0 +1,32 @@
+# Generated by Django 5.1 on 2026-10-19 01:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_profile_rank'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DifficultyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('difficulty', models.CharField(max_length=10)),
+                ('games', models.IntegerField(default=0)),
+                ('score_sum', models.BigIntegerField(default=0)),
+                ('correct_diagnoses', models.IntegerField(default=0)),
+                ('best_score', models.IntegerField(default=0)),
+                ('recent_games', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='difficulty_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'difficulty'), name='unique_stats_per_difficulty')],
+            },
+        ),
+    ]
@@ -1,9 +1,17 @@
-from django.db import models
+from django.db import connection, models, transaction
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.utils.translation import gettext_lazy as _
-from django.db.models import F, Sum
-from django.db.models.signals import post_save
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from django.core.cache import cache
+from django.utils import timezone
+import uuid
+
+from . import hashing
+
+LEADERBOARD_GENERATION_KEY = "leaderboard-generation"
 
 
 class UserManager(BaseUserManager):
@@ -38,6 +46,26 @@ class UserManager(BaseUserManager):
 
         return self._create_user(email, password, **extra_fields)
 
+    def create_user_with_profile(self, email, password, **extra_fields):
+        """
+        Sign up a regular user: one INSERT for the user and one for the profile,
+        in a single transaction, without the profile signals.
+        """
+        if not email:
+            raise ValueError("The given email must be set")
+        user = self.model(email=self.normalize_email(email), **extra_fields)
+        user.set_password(password)
+        user._profile_created = True
+        with transaction.atomic(using=self._db):
+            user.save(using=self._db)
+            # Новый профиль с 0 очков и наибольшим id всегда последний в рейтинге
+            rank = Profile.objects.using(self._db).count() + 1
+            Profile.objects.using(self._db).bulk_create(
+                [Profile(user=user, points=0, rank=rank)]
+            )
+        Profile.bump_leaderboard_generation()
+        return user
+
 
 class CustomUser(AbstractUser):
     username = models.CharField(max_length=40, default="")
@@ -46,11 +74,25 @@ class CustomUser(AbstractUser):
     REQUIRED_FIELDS = []
     objects = UserManager()
 
+    def set_password(self, raw_password):
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        def setter(raw_password):
+            self.set_password(raw_password)
+            self._password = None
+            self.save(update_fields=["password"])
+
+        return hashing.check_password(raw_password, self.password, setter)
+
 
 class Profile(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE)
     points = models.IntegerField(default=0)
     rank = models.IntegerField(default=1)
+    # Курсор инкрементальной выгрузки очков: обновляется при каждом изменении
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     @staticmethod
     def get_top_users(limit=10):
@@ -67,18 +109,67 @@ class Profile(models.Model):
         )
         if self.points != total_points:
             self.points = total_points
-            self.save(update_fields=["points"])
+            self.save(update_fields=["points", "updated_at"])
             self.update_ranks()
+            self.bump_leaderboard_generation()
 
     @classmethod
     def update_ranks(cls):
         profiles = cls.objects.order_by("-points", "id")
         rank = 1
+        changed = False
         for profile in profiles:
             if profile.rank != rank:
                 profile.rank = rank
-                profile.save(update_fields=["rank"])
+                profile.save(update_fields=["rank", "updated_at"])
+                changed = True
             rank += 1
+        if changed:
+            cls.bump_leaderboard_generation()
+
+    @classmethod
+    def recompute_points_and_ranks(cls):
+        """
+        Recompute every profile's points and rank with two UPDATE statements.
+
+        Used after bulk loads that bypass the per-row signals; ranks follow
+        the same (-points, id) order as update_ranks. Only rows whose points
+        or rank change are written, so updated_at stays an export cursor.
+        """
+        from core.models import Chat
+
+        totals = (
+            Chat.objects.filter(doctor_id=OuterRef("user_id"), is_finished=True)
+            .values("doctor_id")
+            .annotate(total=Sum("score"))
+            .values("total")
+        )
+        points = Coalesce(Subquery(totals), 0)
+        now = timezone.now()
+        cls.objects.exclude(points=points).update(points=points, updated_at=now)
+        table = connection.ops.quote_name(cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET rank = ranked.position, updated_at = %s FROM ("
+                f"SELECT id, ROW_NUMBER() OVER (ORDER BY points DESC, id) AS position "
+                f"FROM {table}) AS ranked "
+                f"WHERE {table}.id = ranked.id AND {table}.rank != ranked.position",
+                [connection.ops.adapt_datetimefield_value(now)],
+            )
+        cls.bump_leaderboard_generation()
+
+    @staticmethod
+    def leaderboard_generation():
+        """Token that changes whenever points or ranks change, used as the leaderboard ETag."""
+        generation = cache.get(LEADERBOARD_GENERATION_KEY)
+        if generation is None:
+            cache.add(LEADERBOARD_GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+            generation = cache.get(LEADERBOARD_GENERATION_KEY)
+        return generation
+
+    @staticmethod
+    def bump_leaderboard_generation():
+        cache.set(LEADERBOARD_GENERATION_KEY, uuid.uuid4().hex, timeout=None)
 
     def save(self, *args, **kwargs):
         is_new = self._state.adding
@@ -87,18 +178,58 @@ class Profile(models.Model):
             self.update_ranks()
 
 
+class DifficultyStats(models.Model):
+    """Running totals of a user's finished games at one difficulty."""
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="difficulty_stats")
+    difficulty = models.CharField(max_length=10)
+    games = models.IntegerField(default=0)
+    score_sum = models.BigIntegerField(default=0)
+    correct_diagnoses = models.IntegerField(default=0)
+    best_score = models.IntegerField(default=0)
+    # Последние игры: [{"chat", "correct_diagnosis", "diagnosis", "score", "correct", "finished_at"}]
+    recent_games = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "difficulty"], name="unique_stats_per_difficulty"),
+        ]
+
+
 @receiver(post_save, sender=CustomUser)
 def create_user_profile(sender, instance, created, **kwargs):
-    if created:
+    if created and not getattr(instance, "_profile_created", False):
         Profile.objects.create(user=instance)
 
 
 @receiver(post_save, sender=CustomUser)
 def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
+    if not getattr(instance, "_profile_created", False):
+        instance.profile.save()
 
 
 @receiver(post_save, sender="core.Chat")
 def update_profile_points(sender, instance, **kwargs):
     if instance.is_finished:
         instance.doctor.profile.update_points()
+
+
+# Поля пользователя, которые показывает таблица лидеров
+LEADERBOARD_USER_FIELDS = {"username", "email"}
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_leaderboard(sender, instance, update_fields=None, **kwargs):
+    # Сохранение только last_login или пароля таблицу лидеров не меняет
+    if update_fields is None or LEADERBOARD_USER_FIELDS & set(update_fields):
+        Profile.bump_leaderboard_generation()
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_principal(sender, instance, **kwargs):
+    from .authentication import forget_principal
+
+    forget_principal(instance)
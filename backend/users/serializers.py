@@ -1,7 +1,8 @@
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from django.core.exceptions import ValidationError
-from .models import CustomUser, Profile
+from django.db import IntegrityError
+from rest_framework.settings import api_settings
+from .models import CustomUser, DifficultyStats, Profile
 from django.utils.translation import gettext_lazy as _
 
 
@@ -31,6 +32,29 @@ class ProfileSerializer(serializers.ModelSerializer):
         fields = ("id", "user", "points", "rank")
 
 
+class DifficultyStatsSerializer(serializers.ModelSerializer):
+    average_score = serializers.SerializerMethodField()
+    accuracy = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DifficultyStats
+        fields = (
+            "difficulty",
+            "games",
+            "average_score",
+            "accuracy",
+            "correct_diagnoses",
+            "best_score",
+            "recent_games",
+        )
+
+    def get_average_score(self, obj):
+        return round(obj.score_sum / obj.games) if obj.games else 0
+
+    def get_accuracy(self, obj):
+        return round(obj.correct_diagnoses / obj.games, 3) if obj.games else 0
+
+
 class UserRegistrationSerializer(serializers.ModelSerializer):
     email = serializers.CharField(max_length=255)
     password = serializers.CharField(
@@ -46,19 +70,28 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         fields = ("email", "username", "password")
 
     def create(self, validated_data):
-        user = CustomUser.objects.create(
-            email=validated_data["email"],
-            username=validated_data["username"],
-        )
-        user.set_password(validated_data["password"])
-        user.save()
-        return user
+        # Уникальность email проверяет индекс в базе, без отдельного exists()
+        try:
+            return CustomUser.objects.create_user_with_profile(
+                email=validated_data["email"],
+                username=validated_data["username"],
+                password=validated_data["password"],
+            )
+        except IntegrityError:
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: ["Email has already been used"]}
+            )
 
-    def validate(self, attrs):
 
-        email_exists = CustomUser.objects.filter(email=attrs["email"]).exists()
+class PrincipalTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Adds the claims CachedJWTAuthentication needs for claims-only reads."""
 
-        if email_exists:
-            raise ValidationError("Email has already been used")
+    @classmethod
+    def get_token(cls, user):
+        from .authentication import USER_PK_CLAIM
 
-        return super().validate(attrs)
+        token = super().get_token(user)
+        token[USER_PK_CLAIM] = user.pk
+        token["username"] = user.username
+        token["is_staff"] = user.is_staff
+        return token
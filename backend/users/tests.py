@@ -1,3 +1,54 @@
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from .models import CustomUser
+
+
+class ProfileETagTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="ivan@example.com", password="password", username="Иван"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_profile_with_cyrillic_username_answers_304(self):
+        first = self.client.get("/api/users/profile/")
+        etag = first["ETag"]
+        self.assertTrue(etag.isascii())
+        self.assertNotIn("ivan@example.com", etag)
+
+        second = self.client.get("/api/users/profile/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 304)
+
+    def test_profile_etag_changes_with_username(self):
+        etag = self.client.get("/api/users/profile/")["ETag"]
+        self.user.username = "Админ"
+        self.user.save()
+
+        response = self.client.get("/api/users/profile/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class LeaderboardETagTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="ivan@example.com", password="password", username="Иван"
+        )
+        self.client = APIClient()
+
+    def test_rename_invalidates_leaderboard(self):
+        etag = self.client.get("/api/users/top-users/")["ETag"]
+        self.user.username = "Админ"
+        self.user.save()
+
+        response = self.client.get("/api/users/top-users/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]["user"]["username"], "Админ")
+
+    def test_login_keeps_leaderboard_etag(self):
+        etag = self.client.get("/api/users/top-users/")["ETag"]
+        self.user.save(update_fields=["last_login"])
+
+        response = self.client.get("/api/users/top-users/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
@@ -9,5 +9,6 @@ router.register(r"profiles", ProfileViewSet)
 urlpatterns = [
     path("", include(router.urls)),
     path("profile/", ProfileViewSet.as_view({"get": "my_profile"}), name="my-profile"),
+    path("profile/stats/", ProfileViewSet.as_view({"get": "my_stats"}), name="my-stats"),
     path("top-users/", ProfileViewSet.as_view({"get": "top_users"}), name="top-users"),
 ]
@@ -2,9 +2,11 @@ from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from .models import CustomUser, Profile
+from core.conditional import make_etag, not_modified, with_etag
+from .models import CustomUser, DifficultyStats, Profile
 from .serializers import (
     CustomUserSerializer,
+    DifficultyStatsSerializer,
     ProfileSerializer,
     UserRegistrationSerializer,
 )
@@ -27,6 +29,7 @@ class ProfileViewSet(viewsets.ModelViewSet):
     queryset = Profile.objects.all()
     serializer_class = ProfileSerializer
     permission_classes = [IsAuthenticated]
+    claims_only_actions = ("my_profile", "my_stats", "top_users")
 
     def get_permissions(self):
         if self.action == "top_users":
@@ -35,14 +38,51 @@ class ProfileViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=["GET"])
     def my_profile(self, request):
-        profile, created = Profile.objects.get_or_create(user=request.user)
+        # Очки и ранг обновляются сигналами, поэтому ETag можно проверить
+        # одним запросом, без пересчета очков и сериализации
+        state = (
+            Profile.objects.filter(user_id=request.user.pk)
+            .values_list("id", "points", "rank", "user__username", "user__email")
+            .first()
+        )
+        if state is not None:
+            response = not_modified(request, make_etag("profile", *state))
+            if response is not None:
+                return response
+
+        profile, created = Profile.objects.get_or_create(user_id=request.user.pk)
         profile.update_points()
         serializer = self.get_serializer(profile)
-        return Response(serializer.data)
+        return with_etag(
+            Response(serializer.data),
+            make_etag(
+                "profile",
+                profile.id,
+                profile.points,
+                profile.rank,
+                profile.user.username,
+                profile.user.email,
+            ),
+        )
+
+    @action(detail=False, methods=["GET"])
+    def my_stats(self, request):
+        # Одно чтение по индексу (user, difficulty), без агрегации по чатам
+        stats = DifficultyStats.objects.filter(user_id=request.user.pk).order_by("difficulty")
+        return Response(DifficultyStatsSerializer(stats, many=True).data)
 
     @action(detail=False, methods=["GET"])
     def top_users(self, request):
+        response = not_modified(
+            request, make_etag("leaderboard", Profile.leaderboard_generation())
+        )
+        if response is not None:
+            return response
+
         Profile.update_ranks()  # Обновляем ранги перед получением топ пользователей
         top_profiles = Profile.get_top_users()
         serializer = self.get_serializer(top_profiles, many=True)
-        return Response(serializer.data)
+        return with_etag(
+            Response(serializer.data),
+            make_etag("leaderboard", Profile.leaderboard_generation()),
+        )